@@ -1,7 +1,12 @@
-import os
 import re
 
+import requests
+
 from agent import OllamaAgent
+from context import ContextOverflow, ContextWindow
+from endpoint_pool import EndpointPool, EndpointUnavailable
+from generation import GenerationProfiles
+from transport import OllamaTransport
 
 
 # ReactFramework class to manage the interaction process
@@ -9,7 +14,13 @@ class ReActFramework:
     def __init__(self, args, mode: str, max_steps: int, max_retries: int,
                  illegal_early_stop_patience: int,
                  react_llm_name: str, planner_llm_name: str, agent_prompt: str,
-                 action_mapping: dict, action_handler):
+                 action_mapping: dict, action_handler, transport: OllamaTransport = None,
+                 trace=None, cache=None, context_tokens: int = None, metrics=None, prefetcher=None,
+                 step_mode: str = "two_call", checkpoint=None, generation: GenerationProfiles = None,
+                 keep_alive=None):
+        if step_mode not in ('two_call', 'single'):
+            raise ValueError(f"Invalid step mode: {step_mode}")
+        self.step_mode = step_mode
         self.max_steps = max_steps
         self.mode = mode
         self.react_name = react_llm_name
@@ -17,30 +28,124 @@ class ReActFramework:
         self.agent_prompt = agent_prompt
         self.illegal_early_stop_patience = illegal_early_stop_patience
         self.max_retries = max_retries
-        self.llm = OllamaAgent(llama_url=args.llama_url, model=react_llm_name, stream=args.stream, output=os.path.join(args.output_dir, "output.json"),
-                          messages=[])
+        urls = args.llama_url if isinstance(args.llama_url, list) else [args.llama_url]
+        if transport is None:
+            transport = EndpointPool(urls, max_retries=max_retries, pool_maxsize=args.pool_size,
+                                     connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+        self.transport = transport
+        self.llm = OllamaAgent(llama_url=urls[0], model=react_llm_name, stream=args.stream,
+                          messages=[], transport=self.transport, cache=cache, trace=trace, metrics=metrics,
+                          context=ContextWindow(context_tokens) if context_tokens else None, keep_alive=keep_alive)
+        self.generation = generation if generation is not None else GenerationProfiles()
+        self.metrics = metrics
+        self.prefetcher = prefetcher
+        self.checkpoint = checkpoint
+        self.query_id = None
         self.action_mapping = action_mapping
         self.action_handler = action_handler
         self.__reset_agent()
 
-    def run(self, query: str, reset: bool = True):
-        """Run the agent with a given query."""
+    def run(self, query: str, reset: bool = True, query_id=None, resume: bool = False):
+        """Run the agent with a given query.
+
+        With `resume`, a checkpoint of the same query is restored and the run continues after its last step.
+        """
         self.query = query
+        self.query_id = query_id
         if reset:
             self.__reset_agent()
-        self.llm.add_message("system", self.agent_prompt.format(query=self.query, scratchpad=self.scratchpad))
+        self.action_handler.set_query(query)
+        state = self.checkpoint.load(query_id) if resume and self.checkpoint is not None else None
+        if state is not None and state['query'] == query:
+            print(f"Resuming query {query_id} at step {state['step_n']}")
+            self.set_state(state)
+        else:
+            if self.prefetcher is not None:
+                self.prefetcher.prefetch(self.action_handler, query)
+            self.llm.add_message("system", self.agent_prompt.format(query=self.query, scratchpad=self.scratchpad))
 
+        failures = 0
         while not self.is_halted() and not self.is_finished():
-            self.step()
+            messages, log_length = len(self.llm.messages), len(self.json_log)
+            try:
+                self.timed_step()
+                failures = 0
+                if self.checkpoint is not None:
+                    self.save_checkpoint()
+            except ContextOverflow as e:
+                print(e)
+                self.json_log[-1]['state'] = 'Max Token Length Exceeded.'
+                self.answer = 'Max Token Length Exceeded.'
+                self.finished = True
+            except (EndpointUnavailable, requests.RequestException) as e:
+                # The transport already retried; undo the partial step and try it again a few times
+                failures += 1
+                print(f"Step {self.step_n} failed ({e}), {failures} of {self.illegal_early_stop_patience}")
+                del self.llm.messages[messages:]
+                if failures < self.illegal_early_stop_patience:
+                    del self.json_log[log_length:]
+                else:
+                    del self.json_log[log_length + 1:]
+                    self.json_log[-1]['state'] = f'LLM request failed: {e}'
+                    self.finished = True
 
         return self.answer, self.scratchpad, self.json_log
 
+    def save_checkpoint(self):
+        """Checkpoint the query; a failed save only costs the ability to resume from this step."""
+        try:
+            self.checkpoint.save(self.query_id, self.get_state())
+        except Exception as e:
+            print(f"Warning: could not checkpoint query {self.query_id} at step {self.step_n}: {e}")
+
+    def get_state(self) -> dict:
+        """Return everything needed to continue the current query after its last step."""
+        return {
+            "query": self.query,
+            "step_n": self.step_n,
+            "finished": self.finished,
+            "answer": self.answer,
+            "scratchpad": self.scratchpad,
+            "current_observation": self.current_observation,
+            "messages": self.llm.messages,
+            "json_log": self.json_log,
+            "last_actions": self.last_actions,
+            "retry_record": self.retry_record,
+            "handler": self.action_handler.get_state(),
+        }
+
+    def set_state(self, state: dict):
+        """Restore a state returned by `get_state`."""
+        self.step_n = state['step_n']
+        self.finished = state['finished']
+        self.answer = state['answer']
+        self.scratchpad = state['scratchpad']
+        self.current_observation = state['current_observation']
+        self.llm.messages = state['messages']
+        self.json_log = state['json_log']
+        self.last_actions = state['last_actions']
+        self.retry_record = state['retry_record']
+        self.action_handler.set_state(state['handler'])
+
+    def timed_step(self):
+        """Perform a step, recording its duration when metrics are enabled."""
+        if self.metrics is None:
+            return self.step()
+        with self.metrics.span('step', self.query_id):
+            return self.step()
+
     def step(self):
         """Perform a single step in the agent's reasoning process."""
         self.json_log.append({"step": self.step_n, "thought": "", "action": "", "observation": "", "state": ""})
-        thought = self.prompt_agent(f"Give me thought number {self.step_n} and that only (without extra dialogue) in the following example format:\n\nThought {self.step_n}: [reasoning inserted here]\n")
-        self.json_log[-1]['thought'] = thought
-        action = self.prompt_agent(f"Give me action number {self.step_n} and that only (without extra dialogue) in the following example format:\n\nAction {self.step_n}: \nActionName[Required Information]\n")
+        self.llm.trace_tags = {"query_id": self.query_id, "step": self.step_n}
+        if self.step_mode == 'single':
+            thought, action = self.prompt_thought_action()
+            self.json_log[-1]['thought'] = thought
+        else:
+            thought = self.prompt_agent(f"Give me thought number {self.step_n} and that only (without extra dialogue) in the following example format:\n\nThought {self.step_n}: [reasoning inserted here]\n",
+                                        call_type='thought')
+            self.json_log[-1]['thought'] = thought
+            action = self.prompt_action()
         self.json_log[-1]['action'] = action
 
         if len(self.last_actions) > 0 and self.last_actions[-1] != action:
@@ -67,11 +172,49 @@ class ReActFramework:
 
         # print(self.llm.messages[-5:])
 
-    def prompt_agent(self, message: str) -> str:
-        """Prompt the agent with a message and return the response."""
-        response = self.llm.send_query()
+    def prompt_action(self) -> str:
+        """Prompt the agent for the action of the current step."""
+        return self.prompt_agent(f"Give me action number {self.step_n} and that only (without extra dialogue) in the following example format:\n\nAction {self.step_n}: \nActionName[Required Information]\n",
+                                 stop_when=self.action_complete, call_type='action')
+
+    def prompt_thought_action(self):
+        """Prompt the agent for the thought and the action of the current step in a single generation."""
+        reply = self.prompt_agent(f"Give me thought number {self.step_n} and action number {self.step_n} and those only (without extra dialogue) in the following example format:\n\nThought {self.step_n}: [reasoning inserted here]\nAction {self.step_n}: ActionName[Required Information]\n",
+                                  stop_when=self.action_complete, call_type='thought_action')
+        thought, action = self.split_thought_action(reply)
+        if action is None:
+            # No parsable action in the reply, fall back to asking for it on its own
+            self.json_log[-1]['state'] = 'single-call action missing, fallback'
+            action = self.prompt_action()
+        return thought, action
+
+    def split_thought_action(self, reply: str):
+        """Split a combined reply into its thought and action parts; the action is None when missing."""
+        match = re.search(r'^\W*Action\s*\d*\s*:', reply, re.M | re.I)
+        if match:
+            thought, action = reply[:match.start()], reply[match.start():]
+            if self.parse_action(action)[0] is not None:
+                return thought.strip(), action.strip()
+        match = re.search(r'(\w+)\[(.+)]', reply, re.M)
+        if match:
+            return reply[:match.start()].strip(), reply[match.start():match.end()]
+        return reply.strip(), None
+
+    def prompt_agent(self, message: str, stop_when=None, call_type: str = None) -> str:
+        """Prompt the agent with a message and return the response, using the generation profile of `call_type`."""
+        options = self.generation.options(call_type, self.step_n) if call_type is not None else None
+        response = self.llm.send_query(stop_when=stop_when, instruction=message, options=options)
+        context = self.llm.context
+        if context is not None and context.last_elided:
+            note = f'context truncated: {context.last_elided} messages elided, {context.last_tokens} tokens sent'
+            print(note)
+            self.json_log[-1]['context'] = note
         return response['message']['content']
 
+    def action_complete(self, text: str) -> bool:
+        """Check whether a streamed reply already contains a complete action."""
+        return self.parse_action(text)[0] is not None
+
     def __reset_agent(self):
         """Reset the agent's state."""
         self.step_n = 1
@@ -83,6 +226,9 @@ class ReActFramework:
         self.current_data = None
         self.last_actions = []
         self.llm.messages = []
+        if self.llm.context is not None:
+            self.llm.context.reset()
+        self.action_handler.reset()
         self.retry_record = {key: 0 for key in self.action_mapping.values()}
         self.retry_record['invalidAction'] = 0
 
@@ -99,7 +245,12 @@ class ReActFramework:
         if action_type in self.action_mapping:
             try:
                 action_func = getattr(self.action_handler, f'handle_{action_type.lower()}')
-                action_func(action_arg)
+                if self.metrics is not None:
+                    with self.metrics.span(f'tool.{action_type}', self.query_id):
+                        action_func(action_arg)
+                else:
+                    action_func(action_arg)
+                self.current_observation = self.action_handler.current_observation
             except Exception as e:
                 self.current_observation = f'Error in {action_type}: {str(e)}'
                 self.json_log[-1]['state'] = 'Error'
@@ -1,16 +1,33 @@
 # Llama3 class to interact with the Llama model API
-from typing import Dict, Any, List
-import json
-import requests
+from typing import Callable, Dict, Any, Iterator, List, Optional
+import time
+
+from cache import ResponseCache
+from context import ContextWindow
+from metrics import Metrics
+from trace_writer import TraceWriter
+from transport import OllamaTransport
 
 
 class OllamaAgent:
-    def __init__(self, llama_url: str, model: str, stream: bool, output: str, messages: List[Dict[str, Any]]):
+    def __init__(self, llama_url: str, model: str, stream: bool, messages: List[Dict[str, Any]],
+                 transport: Optional[OllamaTransport] = None, cache: Optional[ResponseCache] = None,
+                 context: Optional[ContextWindow] = None, trace: Optional[TraceWriter] = None,
+                 metrics: Optional[Metrics] = None, keep_alive=None):
         self.llama_url = llama_url
+        # How long the server keeps the model loaded after a call, e.g. "30m" or -1 for always
+        self.keep_alive = keep_alive
         self.model = model
         self.stream = stream
-        self.output = output
         self.messages = messages
+        self.trace = trace
+        self.metrics = metrics
+        # Identifiers attached to every trace record, e.g. the query and step being run
+        self.trace_tags = {}
+        self.transport = transport if transport is not None else OllamaTransport(llama_url)
+        self.cache = cache
+        self.context = context
+        self.last_response = None
 
     def add_message(self, role: str, content: str):
         """Add a message to the list of messages to be sent to the Llama model."""
@@ -19,19 +36,113 @@ class OllamaAgent:
         print(content)
         self.messages.append({"role": role, "content": content})
 
+    def build_request(self, instruction: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the request body for the current list of messages.
 
-    def send_query(self) -> Dict[str, Any]:
-        """Send the query to the Llama model and return the response."""
+        `instruction` is sent as a trailing user message for this call only and is not kept in the history.
+        """
+        trailing = [{"role": "user", "content": instruction}] if instruction is not None else []
+        if self.context is not None:
+            messages = self.context.fit(self.messages, trailing)
+        else:
+            messages = self.messages + trailing
         request = {
             "model": self.model,
-            "messages": self.messages[:],
+            "messages": messages,
             "stream": self.stream
         }
-        # request["messages"][-1]['content'] =  + request["messages"][-1]['content']
-        response = requests.post(self.llama_url, json=request)
-        response_json = response.json()
-        with open(self.output, 'w', encoding='utf-8') as f:
-            json.dump(response_json, f, ensure_ascii=False, indent=4)
-        
+        if options:
+            request["options"] = options
+        if self.keep_alive is not None:
+            request["keep_alive"] = self.keep_alive
+        return request
+
+    def handle_response(self, request: Dict[str, Any], response_json: Dict[str, Any],
+                        elapsed: Optional[float] = None) -> Dict[str, Any]:
+        """Record the response and append the reply to the list of messages.
+
+        `elapsed` is the wall time of the call, None when the response was served from the cache.
+        """
+        if self.metrics is not None:
+            self.metrics.record_llm(response_json, elapsed, self.trace_tags.get('query_id'), self.trace_tags.get('step'))
+        if self.trace is not None:
+            self.trace.write(dict(self.trace_tags, time=time.time(), request=request, response=response_json))
+
         self.add_message("assistant", response_json['message']['content'])
         return response_json
+
+    def stream_query(self, stop_when: Optional[Callable[[str], bool]] = None, instruction: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Stream the reply of the Llama model, yielding the text of each chunk as it arrives.
+
+        `stop_when` is called with the text received so far after every chunk; once it returns
+        True the stream is closed early. The assembled response is stored in `last_response`.
+        """
+        request = self.build_request(instruction, options)
+        request["stream"] = True
+        cached = self.cache.get(request) if self.cache is not None else None
+        if cached is not None:
+            yield cached['message']['content']
+            self.last_response = self.handle_response(request, cached)
+            return
+        content = ''
+        final = {}
+        started = time.perf_counter()
+        chunks = self.transport.stream(request)
+        try:
+            for chunk in chunks:
+                piece = chunk.get('message', {}).get('content', '')
+                if piece:
+                    if not content and self.metrics is not None:
+                        self.metrics.record_span('llm.first_token', time.perf_counter() - started,
+                                                 self.trace_tags.get('query_id'))
+                    content += piece
+                    yield piece
+                if chunk.get('done'):
+                    final = chunk
+                    break
+                if stop_when is not None and stop_when(content):
+                    final = dict(chunk, done=True, done_reason='stop_when')
+                    break
+        finally:
+            chunks.close()
+        elapsed = time.perf_counter() - started
+        final['message'] = {"role": "assistant", "content": content}
+        if self.cache is not None:
+            self.cache.put(request, final)
+        self.last_response = self.handle_response(request, final, elapsed)
+
+    def send_query(self, stop_when: Optional[Callable[[str], bool]] = None, instruction: Optional[str] = None,
+                   options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send the query to the Llama model and return the response."""
+        if self.stream:
+            for _ in self.stream_query(stop_when=stop_when, instruction=instruction, options=options):
+                pass
+            return self.last_response
+        request = self.build_request(instruction, options)
+        # request["messages"][-1]['content'] =  + request["messages"][-1]['content']
+        response_json = self.cache.get(request) if self.cache is not None else None
+        elapsed = None
+        if response_json is None:
+            started = time.perf_counter()
+            response_json = self.transport.post(request)
+            elapsed = time.perf_counter() - started
+            if self.cache is not None:
+                self.cache.put(request, response_json)
+        self.last_response = self.handle_response(request, response_json, elapsed)
+        return self.last_response
+
+    async def asend_query(self, instruction: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send the query without blocking the event loop and return the response."""
+        request = self.build_request(instruction, options)
+        request["stream"] = False
+        response_json = self.cache.get(request) if self.cache is not None else None
+        elapsed = None
+        if response_json is None:
+            started = time.perf_counter()
+            response_json = await self.transport.apost(request)
+            elapsed = time.perf_counter() - started
+            if self.cache is not None:
+                self.cache.put(request, response_json)
+        self.last_response = self.handle_response(request, response_json, elapsed)
+        return self.last_response
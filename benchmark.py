@@ -0,0 +1,245 @@
+# Benchmarks of the agent loop against the mock Ollama server and stub tools
+from typing import Dict, Any, List
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from pandas import DataFrame
+
+from mock_ollama import MockOllamaServer
+from planner import OllamaPlanner
+from ReAct import ReActFramework
+from prompts import zeroshot_react_agent_prompt
+from tokens import count_tokens
+from tool_cache import ToolCache
+from transport import OllamaTransport
+from travel_planner import ActionHandler, action_mapping, run_queries
+
+BENCH_CITIES = ['Ithaca', 'Charlotte']
+BENCH_QUERY = "Could you create a travel plan for 2 people from Ithaca to Charlotte spanning 3 days, " \
+              "from March 8th to March 10th, 2022, with a budget of $3,000?"
+
+
+class StubSearch:
+    """Search tool returning a synthetic table of `rows` rows after `latency` seconds."""
+    columns = ['Name', 'Price', 'City']
+
+    def __init__(self, latency: float = 0.0, rows: int = 50):
+        self.latency = latency
+        self.rows = rows
+
+    def run(self, *args):
+        time.sleep(self.latency)
+        return DataFrame({"Name": [f"{args[0]} {i}" for i in range(self.rows)],
+                          "Price": [100 + i for i in range(self.rows)],
+                          "City": [args[-1]] * self.rows})
+
+
+class StubDistance(StubSearch):
+    def run(self, origin, destination, mode):
+        time.sleep(self.latency)
+        return f"{mode}, from {origin} to {destination}, duration: 9 hours, distance: 900 km, cost: 900"
+
+
+class StubNotebook:
+    def __init__(self):
+        self.data = []
+
+    def write(self, input_data, short_description):
+        self.data.append({"Short Description": short_description, "Content": input_data})
+        return f"The information has been recorded in Notebook, and its index is {len(self.data) - 1}."
+
+    def list_all(self):
+        return [{"index": i, "Short Description": unit["Short Description"], "Content": str(unit["Content"])}
+                for i, unit in enumerate(self.data)]
+
+
+class StubPlanner:
+    def run(self, text, query):
+        return f"Day 1:\nCurrent City: from Ithaca to Charlotte ({len(text)} characters of notes)"
+
+
+class StubActionHandler(ActionHandler):
+    """ActionHandler wired to in-process stub tools instead of the travel database."""
+    tool_latency = 0.0
+
+    def load_tools(self, tools: List[str]) -> Dict[str, Any]:
+        stubs = {
+            "notebook": StubNotebook,
+            "planner": StubPlanner,
+            "googleDistanceMatrix": lambda: StubDistance(self.tool_latency),
+            "cities": lambda: StubSearch(self.tool_latency, rows=5),
+        }
+        return {name: stubs.get(name, lambda: StubSearch(self.tool_latency))() for name in tools}
+
+
+def make_agents(url: str, count: int, stream: bool = False, tool_latency: float = 0.0,
+                tool_cache: ToolCache = None, defer_planner: bool = False) -> List[ReActFramework]:
+    args = argparse.Namespace(llama_url=url, stream=stream, pool_size=max(16, count), connect_timeout=5.0,
+                              read_timeout=60.0)
+    transport = OllamaTransport(url, pool_maxsize=max(16, count))
+    tool_cache = tool_cache if tool_cache is not None else ToolCache()
+    StubActionHandler.tool_latency = tool_latency
+    shared = StubActionHandler(city_set=BENCH_CITIES, tool_cache=tool_cache)
+    return [ReActFramework(args, mode='zero_shot', max_steps=20, max_retries=3, illegal_early_stop_patience=3,
+                           react_llm_name='mock', planner_llm_name='mock', agent_prompt=zeroshot_react_agent_prompt,
+                           action_mapping=action_mapping,
+                           action_handler=StubActionHandler(shared_tools=shared.shared_tools, city_set=BENCH_CITIES,
+                                                            tool_cache=tool_cache, defer_planner=defer_planner),
+                           transport=transport)
+            for _ in range(count)]
+
+
+def bench_react_overhead(queries: int, stream: bool) -> Dict[str, Any]:
+    """Time of the agent loop itself against a zero-latency server."""
+    with MockOllamaServer() as server:
+        agent = make_agents(server.url, 1, stream=stream)[0]
+        started = time.perf_counter()
+        steps = 0
+        for number in range(1, queries + 1):
+            agent.run(BENCH_QUERY, query_id=number)
+            steps += agent.step_n - 1
+        elapsed = time.perf_counter() - started
+    return {"queries": queries, "steps": steps, "llm_calls": server.requests, "seconds": elapsed,
+            "ms_per_step": elapsed * 1000 / max(steps, 1)}
+
+
+def bench_action_handler(calls: int) -> Dict[str, Any]:
+    """Cost of ActionHandler dispatch, validation and encoding, with and without the tool cache."""
+    results = {}
+    for cached in (False, True):
+        handler = StubActionHandler(city_set=BENCH_CITIES, tool_cache=ToolCache(max_entries=4096 if cached else 0))
+        started = time.perf_counter()
+        for _ in range(calls):
+            handler.handle_flightsearch('Ithaca, Charlotte, 2022-03-08')
+            handler.handle_accommodationsearch('Charlotte')
+        elapsed = time.perf_counter() - started
+        results["cached" if cached else "uncached"] = {"calls": calls * 2, "us_per_call": elapsed * 1e6 / (calls * 2)}
+    return results
+
+
+def bench_notebook(repeats: int) -> Dict[str, Any]:
+    """Planner input size and serialization time of the list and compact notebooks, with duplicate writes."""
+    results = {}
+    searches = [('handle_flightsearch', 'Ithaca, Charlotte, 2022-03-08'), ('handle_accommodationsearch', 'Charlotte'),
+                ('handle_restaurantsearch', 'Charlotte'), ('handle_attractionsearch', 'Charlotte'),
+                ('handle_accommodationsearch', 'charlotte'), ('handle_flightsearch', 'Charlotte, Ithaca, 2022-03-10')]
+    for notebook_format in ('list', 'compact'):
+        handler = StubActionHandler(city_set=BENCH_CITIES, tool_cache=ToolCache(), notebook_format=notebook_format)
+        for method, args in searches:
+            getattr(handler, method)(args)
+            handler.handle_notebookwrite(f"{method[7:]} {args}")
+        started = time.perf_counter()
+        for _ in range(repeats):
+            text = handler.notebook_text()
+        elapsed = time.perf_counter() - started
+        results[notebook_format] = {"entries": len(handler.tools['notebook'].data), "characters": len(text),
+                                    "tokens": count_tokens(text), "ms_per_serialize": elapsed * 1000 / repeats}
+    return results
+
+
+def bench_runner(queries: int, concurrency: int, latency: float, tool_latency: float) -> Dict[str, Any]:
+    """Sequential runner versus concurrent agents against a server with per-call latency."""
+    results = {}
+    jobs = [(number, BENCH_QUERY) for number in range(1, queries + 1)]
+    for workers in sorted({1, concurrency}):
+        with MockOllamaServer(latency=latency) as server, tempfile.TemporaryDirectory() as output_path:
+            agents = make_agents(server.url, workers, tool_latency=tool_latency)
+            started = time.perf_counter()
+            failed = run_queries(agents, jobs, output_path, 'mock')
+            elapsed = time.perf_counter() - started
+        results[f"concurrency_{workers}"] = {"queries": queries, "failed": len(failed), "seconds": elapsed,
+                                             "queries_per_sec": queries / elapsed}
+    return results
+
+
+def bench_pipeline(queries: int, concurrency: int, latency: float, planner_latency: float) -> Dict[str, Any]:
+    """Planner calls made inline by the agents versus handed to planner workers on a slower server."""
+    results = {}
+    jobs = [(number, BENCH_QUERY) for number in range(1, queries + 1)]
+    for pipelined in (False, True):
+        with MockOllamaServer(latency=latency) as server, MockOllamaServer(latency=planner_latency) as planner_server, \
+                tempfile.TemporaryDirectory() as output_path:
+            agents = make_agents(server.url, concurrency, defer_planner=pipelined)
+            planner_transport = OllamaTransport(planner_server.url)
+            planner = OllamaPlanner('mock-planner', planner_transport)
+            if not pipelined:
+                # Inline planning goes through the same slow planner model, just on the agents' threads
+                for agent in agents:
+                    agent.action_handler.tools['planner'] = OllamaPlanner('mock-planner', planner_transport)
+            started = time.perf_counter()
+            failed = run_queries(agents, jobs, output_path, 'mock', planners=[planner] if pipelined else None)
+            elapsed = time.perf_counter() - started
+        results["pipelined" if pipelined else "inline"] = {"queries": queries, "failed": len(failed),
+                                                           "seconds": elapsed, "queries_per_sec": queries / elapsed}
+    return results
+
+
+def bench_memory(queries: int) -> Dict[str, Any]:
+    """Traced memory after each query of a long run on one agent."""
+    with MockOllamaServer() as server:
+        agent = make_agents(server.url, 1)[0]
+        tracemalloc.start()
+        samples = []
+        for number in range(1, queries + 1):
+            agent.run(BENCH_QUERY, query_id=number)
+            samples.append(tracemalloc.get_traced_memory()[0])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    half = len(samples) // 2
+    return {"queries": queries, "first_bytes": samples[0], "last_bytes": samples[-1], "peak_bytes": peak,
+            "growth_bytes_per_query": (samples[-1] - samples[half]) / max(len(samples) - 1 - half, 1)}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], prefix: str = ''):
+    """Print the relative change of every numeric result against a baseline run."""
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(baseline.get(key), dict):
+            compare(value, baseline[key], f"{name}.")
+        elif isinstance(value, (int, float)) and isinstance(baseline.get(key), (int, float)) and baseline[key]:
+            print(f"{name}: {baseline[key]:.4g} -> {value:.4g} ({(value - baseline[key]) / baseline[key]:+.1%})")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return ''
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="bench_results.json", type=str)
+    parser.add_argument("--baseline", default=None, type=str, help="earlier results to compare against")
+    parser.add_argument("--queries", default=20, type=int)
+    parser.add_argument("--concurrency", default=8, type=int)
+    parser.add_argument("--latency", default=0.05, type=float, help="mock server seconds per call")
+    parser.add_argument("--planner_latency", default=0.5, type=float, help="mock planner server seconds per call")
+    parser.add_argument("--tool_latency", default=0.01, type=float, help="stub tool seconds per call")
+    args = parser.parse_args()
+
+    benchmarks = {
+        "react_overhead": bench_react_overhead(args.queries, stream=False),
+        "react_overhead_stream": bench_react_overhead(args.queries, stream=True),
+        "action_handler": bench_action_handler(args.queries * 50),
+        "notebook": bench_notebook(args.queries),
+        "runner": bench_runner(args.queries, args.concurrency, args.latency, args.tool_latency),
+        "pipeline": bench_pipeline(args.queries, args.concurrency, args.latency, args.planner_latency),
+        "memory": bench_memory(args.queries * 5),
+    }
+    results = {"time": time.strftime('%Y-%m-%dT%H:%M:%S'), "commit": git_commit(),
+               "python": platform.python_version(), "benchmarks": benchmarks}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(json.dumps(benchmarks, indent=4))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(benchmarks, json.load(f)["benchmarks"])
@@ -0,0 +1,98 @@
+# On-disk cache of LLM responses keyed by the content of the request
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class ResponseCache:
+    """Content-addressed cache of chat responses with a size limit and LRU eviction.
+
+    Entries are zlib-compressed JSON files named after the hash of the model, the
+    messages and the options of the request. In replay mode every lookup must hit.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30, replay: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order of the existing entries from their access times."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json.z'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len('.json.z')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json.z')
+
+    @staticmethod
+    def key(request: Dict[str, Any]) -> str:
+        """Hash the parts of a request that determine the response."""
+        content = {k: v for k, v in request.items() if k not in ('stream', 'keep_alive')}
+        blob = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def get(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a request, or None (CacheMiss in replay mode)."""
+        key = self.key(request)
+        with self._lock:
+            if key in self._entries:
+                path = self._path(key)
+                try:
+                    with open(path, 'rb') as f:
+                        response = json.loads(zlib.decompress(f.read()))
+                    os.utime(path)
+                except (FileNotFoundError, zlib.error, ValueError):
+                    # Evicted by another process sharing the directory, cleaned up or corrupt
+                    self._size -= self._entries.pop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+            self.misses += 1
+        if self.replay:
+            raise CacheMiss(f"No cached response for request {key}")
+        return None
+
+    def put(self, request: Dict[str, Any], response: Dict[str, Any]):
+        """Store a response and evict the least recently used entries beyond the size limit."""
+        key = self.key(request)
+        data = zlib.compress(json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,73 @@
+# Per-query checkpoints of the agent state, written after every step
+from typing import Dict, Any, Optional
+import json
+import os
+import threading
+import zlib
+
+from observation import is_dataframe
+
+_DATAFRAME = '__dataframe__'
+
+
+def _encode(value: Any) -> Any:
+    if is_dataframe(value):
+        return {_DATAFRAME: value.to_dict(orient='split')}
+    if hasattr(value, 'item'):
+        # NumPy scalars from DataFrame cells
+        return value.item()
+    # Anything else, e.g. the error object a tool returns for a bad argument, is kept as its text
+    return str(value)
+
+
+def _decode(value: Dict[str, Any]) -> Any:
+    if _DATAFRAME in value and len(value) == 1:
+        from pandas import DataFrame
+
+        split = value[_DATAFRAME]
+        return DataFrame(split['data'], index=split['index'], columns=split['columns'])
+    return value
+
+
+class CheckpointStore:
+    """Directory of zlib-compressed JSON checkpoints, one file per query.
+
+    Files are replaced atomically, so a crash leaves either the previous or the new checkpoint.
+    Tool results held in the state (notebook entries, the last search) may be DataFrames.
+    """
+
+    def __init__(self, checkpoint_dir: str, fsync: bool = True):
+        self.checkpoint_dir = checkpoint_dir
+        self.fsync = fsync
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _path(self, query_id) -> str:
+        return os.path.join(self.checkpoint_dir, f'query_{query_id}.ckpt')
+
+    def save(self, query_id, state: Dict[str, Any]):
+        """Write the state of a query, replacing its previous checkpoint."""
+        data = zlib.compress(json.dumps(state, default=_encode, ensure_ascii=False,
+                                        separators=(',', ':')).encode('utf-8'))
+        path = self._path(query_id)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, query_id) -> Optional[Dict[str, Any]]:
+        """Return the last checkpointed state of a query, or None."""
+        try:
+            with open(self._path(query_id), 'rb') as f:
+                return json.loads(zlib.decompress(f.read()), object_hook=_decode)
+        except FileNotFoundError:
+            return None
+
+    def remove(self, query_id):
+        """Drop the checkpoint of a query once its results are saved."""
+        try:
+            os.remove(self._path(query_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,100 @@
+# Hash and trigram index over the valid city names
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+import re
+
+
+def normalize_city(name: str) -> str:
+    """Case-fold a city name and drop punctuation and repeated whitespace."""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', name).casefold().split())
+
+
+# Words that may follow a city name without changing which city is meant: "city", states and the country
+_STATES = {
+    'al': 'alabama', 'ak': 'alaska', 'az': 'arizona', 'ar': 'arkansas', 'ca': 'california', 'co': 'colorado',
+    'ct': 'connecticut', 'de': 'delaware', 'fl': 'florida', 'ga': 'georgia', 'hi': 'hawaii', 'id': 'idaho',
+    'il': 'illinois', 'in': 'indiana', 'ia': 'iowa', 'ks': 'kansas', 'ky': 'kentucky', 'la': 'louisiana',
+    'me': 'maine', 'md': 'maryland', 'ma': 'massachusetts', 'mi': 'michigan', 'mn': 'minnesota',
+    'ms': 'mississippi', 'mo': 'missouri', 'mt': 'montana', 'ne': 'nebraska', 'nv': 'nevada',
+    'nh': 'new hampshire', 'nj': 'new jersey', 'nm': 'new mexico', 'ny': 'new york', 'nc': 'north carolina',
+    'nd': 'north dakota', 'oh': 'ohio', 'ok': 'oklahoma', 'or': 'oregon', 'pa': 'pennsylvania',
+    'ri': 'rhode island', 'sc': 'south carolina', 'sd': 'south dakota', 'tn': 'tennessee', 'tx': 'texas',
+    'ut': 'utah', 'vt': 'vermont', 'va': 'virginia', 'wa': 'washington', 'wv': 'west virginia',
+    'wi': 'wisconsin', 'wy': 'wyoming', 'dc': 'district of columbia', 'pr': 'puerto rico',
+}
+_SUFFIX = re.compile(r'(?: (?:city|us|usa|united states|' +
+                     '|'.join(sorted(set(_STATES) | set(_STATES.values()), key=len, reverse=True)) + r'))+')
+
+
+def _trigrams(name: str) -> set:
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityIndex:
+    """Exact lookups by normalized name plus fuzzy matching through a trigram inverted index.
+
+    A misspelled name is auto-corrected when its best match scores at least `auto_correct_threshold`
+    and clearly beats the runner-up; otherwise the best matches are offered as suggestions.
+    """
+
+    def __init__(self, cities: Iterable[str], auto_correct_threshold: float = 0.75, margin: float = 0.05):
+        self.cities = list(cities)
+        self.auto_correct_threshold = auto_correct_threshold
+        self.margin = margin
+        self._exact = set(self.cities)
+        self._normalized = {}
+        self._gram_counts = {}
+        self._postings = defaultdict(list)
+        for city in self.cities:
+            key = normalize_city(city)
+            if key in self._normalized:
+                continue
+            self._normalized[key] = city
+            grams = _trigrams(key)
+            self._gram_counts[key] = len(grams)
+            for gram in grams:
+                self._postings[gram].append(key)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._exact
+
+    def __iter__(self):
+        return iter(self.cities)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def matches(self, name: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Return the closest cities with their similarity scores, best first."""
+        key = normalize_city(name)
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] += 1
+        scored = []
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + self._gram_counts[candidate])
+            # "New York City" or "Charlotte NC" are the real name with a suffix and are safe to correct.
+            # Other names containing a city as whole words, like "Jackson Hole", only suggest it.
+            if key.startswith(candidate) and _SUFFIX.fullmatch(key[len(candidate):]):
+                score = max(score, 0.8 + 0.2 * len(candidate) / len(key))
+            elif re.search(rf'(^| ){re.escape(candidate)}( |$)', key):
+                score = min(score, 0.5 + 0.2 * len(candidate) / len(key))
+            scored.append((self._normalized[candidate], score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def resolve(self, name: str) -> Tuple[Optional[str], List[str]]:
+        """Return the canonical city for a name (or None) and suggestions when it cannot be resolved."""
+        if name in self._exact:
+            return name, []
+        city = self._normalized.get(normalize_city(name))
+        if city is not None:
+            return city, []
+        matches = self.matches(name)
+        if matches and matches[0][1] >= self.auto_correct_threshold and \
+                (len(matches) == 1 or matches[0][1] - matches[1][1] >= self.margin):
+            return matches[0][0], []
+        return None, [city for city, _ in matches]
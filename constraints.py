@@ -0,0 +1,121 @@
+# Query constraints applied to tool result tables before the agent sees them
+from datetime import date
+from typing import Any, Dict, Tuple
+import re
+
+import numpy as np
+
+from observation import is_dataframe
+from query_info import parse_query
+
+# Room type phrases of the TravelPlanner queries and the `room type` values they allow
+ROOM_TYPES = [
+    (re.compile(r'\bentire (?:room|home|apartment)', re.I), ['Entire home/apt']),
+    (re.compile(r'\bprivate room', re.I), ['Private room']),
+    (re.compile(r'\bshared room', re.I), ['Shared room']),
+]
+ALL_ROOM_TYPES = ['Entire home/apt', 'Private room', 'Shared room']
+# "not shared rooms", "don't want shared rooms", "avoid shared rooms", "no shared rooms", ...
+# The negation must be in the same clause, within four words of the room type
+_NEGATION = re.compile(r"\b(?:not|no|never|avoid|avoiding|without|don't|doesn't|won't|isn't|aren't)\b"
+                       r"(?:\s+(?!and\b|but\b|or\b|with\b)[\w']+){0,4}?\s+$", re.I)
+
+
+def room_types(query: str):
+    """Return the room types a query allows, or None when it states no preference.
+
+    A negated phrase ("we'd prefer not to stay in shared rooms") excludes its room type instead.
+    """
+    for pattern, allowed in ROOM_TYPES:
+        match = pattern.search(query)
+        if match is None:
+            continue
+        if _NEGATION.search(query[max(0, match.start() - 60):match.start()]):
+            return [room_type for room_type in ALL_ROOM_TYPES if room_type not in allowed]
+        return allowed
+    return None
+
+
+def query_constraints(query: str) -> Dict[str, Any]:
+    """Read the constraints a query states: budget, party size, longest possible stay and room types."""
+    info = parse_query(query)
+    days = info['days']
+    if days is None and info['start_date'] and info['end_date']:
+        days = (date.fromisoformat(info['end_date']) - date.fromisoformat(info['start_date'])).days + 1
+    max_nights = None
+    if days:
+        # Every other city on the route needs at least one night
+        max_nights = max(days - info['visiting_city_number'], 1)
+    return {
+        "budget": info['budget'],
+        "people_number": info['people_number'] or 1,
+        "max_nights": max_nights,
+        "room_types": room_types(query),
+    }
+
+
+def _numeric(data, column: str) -> np.ndarray:
+    """A column as floats; unparsable cells and missing columns are NaN, which no check rejects."""
+    import pandas as pd
+
+    if column not in data.columns:
+        return np.full(len(data), np.nan)
+    return pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float)
+
+
+class ConstraintFilter:
+    """Drops the rows of a search result that break the query's constraints and ranks the rest.
+
+    All checks are column operations over the whole table. A row is only dropped for a constraint it
+    clearly breaks on its own, e.g. a flight whose fares for the party alone exceed the budget. When
+    nothing survives the table is returned unfiltered, so the agent still sees what exists.
+    """
+
+    def __init__(self, constraints: Dict[str, Any]):
+        self.constraints = constraints
+
+    @classmethod
+    def from_query(cls, query: str) -> 'ConstraintFilter':
+        return cls(query_constraints(query))
+
+    def _flights(self, data) -> Tuple[np.ndarray, list]:
+        keep = np.ones(len(data), dtype=bool)
+        cost = _numeric(data, 'Price') * self.constraints['people_number']
+        if self.constraints['budget'] is not None:
+            keep &= ~(cost > self.constraints['budget'])
+        return keep, [cost]
+
+    def _accommodations(self, data) -> Tuple[np.ndarray, list]:
+        keep = np.ones(len(data), dtype=bool)
+        room_types = self.constraints['room_types']
+        if room_types is not None and 'room type' in data.columns:
+            keep &= data['room type'].isin(room_types).to_numpy()
+        min_nights = _numeric(data, 'minimum nights')
+        if self.constraints['max_nights'] is not None:
+            keep &= ~(min_nights > self.constraints['max_nights'])
+        # Parties larger than a listing's occupancy need several rooms
+        rooms = np.ceil(self.constraints['people_number'] / np.maximum(_numeric(data, 'maximum occupancy'), 1))
+        nightly = _numeric(data, 'price') * rooms
+        if self.constraints['budget'] is not None:
+            keep &= ~(nightly * np.maximum(min_nights, 1) > self.constraints['budget'])
+        return keep, [nightly, -_numeric(data, 'review rate number')]
+
+    def _restaurants(self, data) -> Tuple[np.ndarray, list]:
+        keep = np.ones(len(data), dtype=bool)
+        cost = _numeric(data, 'Average Cost') * self.constraints['people_number']
+        if self.constraints['budget'] is not None:
+            keep &= ~(cost > self.constraints['budget'])
+        return keep, [-_numeric(data, 'Aggregate Rating'), cost]
+
+    def apply(self, data: Any, tool_name: str) -> Tuple[Any, int]:
+        """Return the filtered and ranked table and the number of rows dropped."""
+        rule = getattr(self, f'_{tool_name}', None)
+        if rule is None or not is_dataframe(data) or len(data) == 0:
+            return data, 0
+        keep, rank_keys = rule(data)
+        if not keep.any():
+            return data, 0
+        # np.lexsort sorts by the last key first; missing values go last
+        keys = [np.nan_to_num(key[keep], nan=np.inf) for key in reversed(rank_keys)]
+        order = np.lexsort(keys) if keys else np.arange(keep.sum())
+        return data[keep].iloc[order], int(len(data) - keep.sum())
@@ -0,0 +1,86 @@
+# Token-bounded view of the conversation sent to the model
+from typing import Dict, Any, List, Optional
+
+from tokens import count_tokens
+
+NOTEBOOK_MARKER = 'The information has been recorded in Notebook'
+# Room left for the notice that replaces the elided messages
+NOTICE_TOKENS = 24
+
+
+class ContextOverflow(Exception):
+    pass
+
+
+class ContextWindow:
+    """Sliding window over the message history that keeps the prompt within a token budget.
+
+    The system prompt, the latest action/observation pair (and anything after it) and the
+    notebook write confirmations are always kept; the oldest remaining messages are elided first.
+    """
+
+    def __init__(self, token_budget: int = 8192, message_overhead: int = 4):
+        self.token_budget = token_budget
+        self.message_overhead = message_overhead
+        self.last_tokens = 0
+        self.last_elided = 0
+        self.truncations = 0
+        self._counts = {}
+
+    def reset(self):
+        self.last_tokens = 0
+        self.last_elided = 0
+        self.truncations = 0
+        self._counts.clear()
+
+    def count(self, message: Dict[str, Any]) -> int:
+        content = message['content']
+        if content not in self._counts:
+            self._counts[content] = count_tokens(content) + self.message_overhead
+        return self._counts[content]
+
+    def _pinned(self, messages: List[Dict[str, Any]]) -> set:
+        """Indexes of the messages that are never elided."""
+        pinned = {0}
+        last_observation = max((i for i, message in enumerate(messages) if message['role'] == 'user'), default=None)
+        if last_observation is not None:
+            pinned.update(range(max(1, last_observation - 1), len(messages)))
+        else:
+            pinned.update(range(1, len(messages)))
+        for i, message in enumerate(messages):
+            if message['role'] == 'user' and message['content'].startswith(NOTEBOOK_MARKER):
+                pinned.update((i - 1, i) if i > 1 else (i,))
+        return pinned
+
+    def fit(self, messages: List[Dict[str, Any]], trailing: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Return the messages to send, eliding the oldest unpinned ones beyond the budget.
+
+        `trailing` messages are appended after the history for this call only; they are always sent
+        and count against the budget.
+        """
+        trailing = trailing or []
+        if not messages:
+            return trailing[:]
+        pinned = self._pinned(messages)
+        used = sum(self.count(messages[i]) for i in pinned) + sum(self.count(message) for message in trailing)
+        if used > self.token_budget:
+            raise ContextOverflow(f"{used} pinned tokens exceed the context budget of {self.token_budget}")
+
+        keep = set(pinned)
+        for i in range(len(messages) - 1, 0, -1):
+            if i in keep:
+                continue
+            cost = self.count(messages[i])
+            if used + cost > self.token_budget - NOTICE_TOKENS:
+                break
+            keep.add(i)
+            used += cost
+
+        self.last_elided = len(messages) - len(keep)
+        self.last_tokens = used
+        if self.last_elided == 0:
+            return messages + trailing
+        self.truncations += 1
+        notice = {"role": "user", "content": f"[{self.last_elided} earlier messages were elided to fit the context.]"}
+        self.last_tokens += self.count(notice)
+        return [messages[0], notice] + [messages[i] for i in sorted(keep) if i != 0] + trailing
@@ -0,0 +1,219 @@
+# Load-balanced pool of Ollama endpoints with health probes, retries and backoff
+from typing import Dict, Any, Iterator, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+import asyncio
+import random
+import threading
+import time
+
+import requests
+
+from transport import OllamaTransport
+
+
+class EndpointUnavailable(Exception):
+    pass
+
+
+def is_transient(error: Exception) -> bool:
+    """Errors worth retrying on another endpoint: connection problems, timeouts, 429 and 5xx."""
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 500
+        return status == 429 or status >= 500
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'status', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return type(error).__module__.startswith('aiohttp')
+
+
+class Endpoint:
+    def __init__(self, transport: OllamaTransport, max_concurrency: Optional[int]):
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+
+    @property
+    def url(self) -> str:
+        return self.transport.llama_url
+
+    def has_capacity(self) -> bool:
+        return self.max_concurrency is None or self.outstanding < self.max_concurrency
+
+
+class EndpointPool:
+    """Drop-in replacement for OllamaTransport spreading requests over several servers.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests that is below its
+    concurrency cap. Transient failures are retried on the next best endpoint after a jittered
+    exponential backoff, up to `max_retries` times.
+    """
+
+    def __init__(self, urls: List[str], max_concurrency: Optional[int] = None, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 10.0, health_interval: Optional[float] = 30.0,
+                 **transport_kwargs):
+        if not urls:
+            raise ValueError("At least one endpoint URL is required")
+        self.endpoints = [Endpoint(OllamaTransport(url, **transport_kwargs), max_concurrency) for url in urls]
+        self.llama_url = urls[0]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        if health_interval and len(self.endpoints) > 1:
+            threading.Thread(target=self._probe_loop, args=(health_interval,), name='endpoint-health',
+                             daemon=True).start()
+
+    def _try_acquire(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """Reserve the least loaded endpoint with spare capacity, waiting for healthy ones while any exist."""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy] or self.endpoints
+        if exclude is not None and len(candidates) > 1:
+            candidates = [endpoint for endpoint in candidates if endpoint is not exclude]
+        candidates = [endpoint for endpoint in candidates if endpoint.has_capacity()]
+        if not candidates:
+            return None
+        endpoint = min(candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.failures))
+        endpoint.outstanding += 1
+        return endpoint
+
+    def _acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        with self._cond:
+            endpoint = self._try_acquire(exclude)
+            while endpoint is None:
+                self._cond.wait()
+                endpoint = self._try_acquire(exclude)
+            return endpoint
+
+    async def _aacquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        while True:
+            with self._cond:
+                endpoint = self._try_acquire(exclude)
+            if endpoint is not None:
+                return endpoint
+            await asyncio.sleep(0.01)
+
+    def _release(self, endpoint: Endpoint, error: Optional[Exception] = None):
+        with self._cond:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                endpoint.healthy = False
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        last, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            endpoint = self._acquire(exclude=last)
+            try:
+                response = endpoint.transport.post(request)
+            except Exception as e:
+                self._release(endpoint, e)
+                if not is_transient(e):
+                    raise
+                last, error = endpoint, e
+                print(f"Request to {endpoint.url} failed ({e}), attempt {attempt + 1} of {self.max_retries + 1}")
+                continue
+            self._release(endpoint)
+            return response
+        raise EndpointUnavailable(f"All {self.max_retries + 1} attempts failed, last error: {error}") from error
+
+    def stream(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Stream from the best endpoint; only failures before the first chunk are retried."""
+        last, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            endpoint = self._acquire(exclude=last)
+            started = False
+            try:
+                for chunk in endpoint.transport.stream(request):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                self._release(endpoint)
+                raise
+            except Exception as e:
+                self._release(endpoint, e)
+                if started or not is_transient(e):
+                    raise
+                last, error = endpoint, e
+                print(f"Stream from {endpoint.url} failed ({e}), attempt {attempt + 1} of {self.max_retries + 1}")
+                continue
+            self._release(endpoint)
+            return
+        raise EndpointUnavailable(f"All {self.max_retries + 1} attempts failed, last error: {error}") from error
+
+    async def apost(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        last, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1))
+            endpoint = await self._aacquire(exclude=last)
+            try:
+                response = await endpoint.transport.apost(request)
+            except Exception as e:
+                self._release(endpoint, e)
+                if not is_transient(e):
+                    raise
+                last, error = endpoint, e
+                continue
+            self._release(endpoint)
+            return response
+        raise EndpointUnavailable(f"All {self.max_retries + 1} attempts failed, last error: {error}") from error
+
+    def warm_up(self, model: str, keep_alive=None):
+        """Load a model on every endpoint in parallel; endpoints that fail are reported and skipped."""
+        def load(endpoint: Endpoint):
+            try:
+                seconds = endpoint.transport.warm_up(model, keep_alive)
+                print(f"Loaded {model} on {endpoint.url} in {seconds:.1f}s")
+            except requests.RequestException as e:
+                print(f"Could not load {model} on {endpoint.url}: {e}")
+
+        threads = [threading.Thread(target=load, args=(endpoint,), name='endpoint-warm-up')
+                   for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        """Check that an endpoint answers its version route."""
+        parts = urlsplit(endpoint.url)
+        try:
+            response = endpoint.transport.session.get(urlunsplit(parts._replace(path='/api/version')),
+                                                      timeout=endpoint.transport.connect_timeout)
+            return response.ok
+        except requests.RequestException:
+            return False
+
+    def _probe_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            for endpoint in self.endpoints:
+                healthy = self.probe(endpoint)
+                with self._cond:
+                    endpoint.healthy = healthy
+                    if healthy:
+                        endpoint.failures = 0
+                    self._cond.notify_all()
+
+    def close(self):
+        self._closed.set()
+        for endpoint in self.endpoints:
+            endpoint.transport.close()
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.transport.aclose()
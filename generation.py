@@ -0,0 +1,45 @@
+# Per call type generation options sent with every Ollama request
+from typing import Dict, Any, Optional
+import copy
+
+# `{step}` and `{next_step}` in stop strings are filled in with the step being prompted
+DEFAULT_PROFILES = {
+    "thought": {"num_predict": 256, "stop": ["Action {step}:", "Observation {step}:"]},
+    "action": {"num_predict": 256, "stop": ["Observation {step}", "Thought {next_step}"]},
+    "thought_action": {"num_predict": 512, "stop": ["Observation {step}", "Thought {next_step}"]},
+    "planner": {"num_predict": 1024},
+}
+
+
+class GenerationProfiles:
+    """Max tokens, stop strings and context size for each kind of call: thought, action, thought_action, planner.
+
+    A value of None leaves the option to the server's default.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.profiles = copy.deepcopy(DEFAULT_PROFILES)
+        for call_type, options in (profiles or {}).items():
+            self.profiles.setdefault(call_type, {}).update(options)
+
+    @classmethod
+    def from_args(cls, args) -> 'GenerationProfiles':
+        """Build the profiles from the command-line token and context limits."""
+        profiles = {
+            "thought": {"num_predict": args.thought_tokens, "num_ctx": args.num_ctx},
+            "action": {"num_predict": args.action_tokens, "num_ctx": args.num_ctx},
+            "thought_action": {"num_predict": args.thought_tokens + args.action_tokens, "num_ctx": args.num_ctx},
+            "planner": {"num_predict": args.planner_tokens, "num_ctx": args.planner_num_ctx},
+        }
+        return cls(profiles)
+
+    def options(self, call_type: str, step: Optional[int] = None) -> Dict[str, Any]:
+        """Return the Ollama options of a call type for the given step."""
+        options = {}
+        for name, value in self.profiles.get(call_type, {}).items():
+            if value is None:
+                continue
+            if name == 'stop':
+                value = [stop.format(step=step, next_step=(step or 0) + 1) for stop in value]
+            options[name] = value
+        return options
@@ -0,0 +1,149 @@
+# Latency and throughput instrumentation for LLM calls, agent steps and tools
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+import json
+import os
+import threading
+import time
+
+NANOSECONDS = 1e9
+
+
+class Metrics:
+    """Thread-safe recorder of timed spans and token counts, grouped by query.
+
+    Span names are dotted, e.g. `llm.prefill`, `llm.decode`, `tool.FlightSearch`, `io.write_plan`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = defaultdict(lambda: {"spans": defaultdict(lambda: [0, 0.0]), "llm_calls": []})
+        self._span_totals = defaultdict(lambda: [0, 0.0])
+        self._token_totals = defaultdict(int)
+
+    def record_span(self, name: str, seconds: float, query_id=None):
+        with self._lock:
+            for totals in (self._queries[query_id]["spans"][name], self._span_totals[name]):
+                totals[0] += 1
+                totals[1] += seconds
+
+    @contextmanager
+    def span(self, name: str, query_id=None):
+        """Time the body of a `with` block as a span."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - started, query_id)
+
+    def record_llm(self, response: Dict[str, Any], elapsed: Optional[float], query_id=None, step=None):
+        """Record the timings and token counts Ollama reports with every response.
+
+        `elapsed` is the wall time of the call, or None when the response came from the cache.
+        """
+        if elapsed is None:
+            self.record_span('llm.cached', 0.0, query_id)
+            return
+        prompt_tokens = response.get('prompt_eval_count', 0)
+        eval_tokens = response.get('eval_count', 0)
+        self.record_span('llm.call', elapsed, query_id)
+        for name, field in (('llm.load', 'load_duration'), ('llm.prefill', 'prompt_eval_duration'),
+                            ('llm.decode', 'eval_duration')):
+            if field in response:
+                self.record_span(name, response[field] / NANOSECONDS, query_id)
+        call = {
+            "step": step,
+            "seconds": elapsed,
+            "prompt_tokens": prompt_tokens,
+            "eval_tokens": eval_tokens,
+            "prefill_tokens_per_sec": _rate(prompt_tokens, response.get('prompt_eval_duration')),
+            "decode_tokens_per_sec": _rate(eval_tokens, response.get('eval_duration')),
+        }
+        with self._lock:
+            self._queries[query_id]["llm_calls"].append(call)
+            self._token_totals['prompt'] += prompt_tokens
+            self._token_totals['eval'] += eval_tokens
+
+    def query_summary(self, query_id) -> Dict[str, Any]:
+        """Summarize the spans, throughput and prompt growth of one query."""
+        with self._lock:
+            query = self._queries.get(query_id, {"spans": {}, "llm_calls": []})
+            spans = {name: {"count": count, "seconds": seconds} for name, (count, seconds) in query["spans"].items()}
+            calls = list(query["llm_calls"])
+        prompt_by_step = {}
+        for call in calls:
+            prompt_by_step[call["step"]] = max(prompt_by_step.get(call["step"], 0), call["prompt_tokens"])
+        decode_seconds = spans.get('llm.decode', {}).get('seconds', 0.0)
+        prefill_seconds = spans.get('llm.prefill', {}).get('seconds', 0.0)
+        eval_tokens = sum(call["eval_tokens"] for call in calls)
+        prompt_tokens = sum(call["prompt_tokens"] for call in calls)
+        return {
+            "query_id": query_id,
+            "spans": spans,
+            "llm_calls": len(calls),
+            "prompt_tokens": prompt_tokens,
+            "eval_tokens": eval_tokens,
+            "prefill_tokens_per_sec": prompt_tokens / prefill_seconds if prefill_seconds else None,
+            "decode_tokens_per_sec": eval_tokens / decode_seconds if decode_seconds else None,
+            # Agent steps in order, then the planner call, which has no step
+            "prompt_tokens_by_step": [prompt_by_step[step] for step in
+                                      sorted(prompt_by_step, key=lambda step: (step is None, step or 0))],
+            "calls": calls,
+        }
+
+    def write_query_summary(self, path: str, query_id):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.query_summary(query_id), f, indent=4)
+
+    def prometheus_text(self) -> str:
+        """Render the run totals in the Prometheus text exposition format."""
+        with self._lock:
+            spans = {name: tuple(totals) for name, totals in self._span_totals.items()}
+            tokens = dict(self._token_totals)
+        lines = ['# TYPE agent_span_seconds summary']
+        for name in sorted(spans):
+            count, seconds = spans[name]
+            lines.append(f'agent_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+            lines.append(f'agent_span_seconds_count{{span="{name}"}} {count}')
+        lines.append('# TYPE agent_tokens_total counter')
+        for kind in sorted(tokens):
+            lines.append(f'agent_tokens_total{{kind="{kind}"}} {tokens[kind]}')
+        decode = spans.get('llm.decode', (0, 0.0))[1]
+        if decode:
+            lines.append('# TYPE agent_decode_tokens_per_second gauge')
+            lines.append(f'agent_decode_tokens_per_second {tokens.get("eval", 0) / decode:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        """Atomically replace a Prometheus text file, e.g. for the node exporter textfile collector."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """Serve the Prometheus text on http://0.0.0.0:<port>/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+
+def _rate(tokens: int, duration_ns: Optional[int]) -> Optional[float]:
+    return tokens * NANOSECONDS / duration_ns if duration_ns else None
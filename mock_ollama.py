@@ -0,0 +1,167 @@
+# Deterministic local stand-in for the Ollama chat API, used by the benchmarks
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+import argparse
+import json
+import re
+import threading
+import time
+
+# Actions replayed for every query, one per step
+DEFAULT_SCRIPT = [
+    "FlightSearch[Ithaca, Charlotte, 2022-03-08]",
+    "NotebookWrite[Flights from Ithaca to Charlotte on 2022-03-08]",
+    "AccommodationSearch[Charlotte]",
+    "NotebookWrite[Accommodations in Charlotte]",
+    "RestaurantSearch[Charlotte]",
+    "NotebookWrite[Restaurants in Charlotte]",
+    "AttractionSearch[Charlotte]",
+    "NotebookWrite[Attractions in Charlotte]",
+    "GoogleDistanceMatrix[Charlotte, Ithaca, taxi]",
+    "NotebookWrite[Taxi from Charlotte to Ithaca]",
+    "FlightSearch[Charlotte, Ithaca, 2022-03-10]",
+    "NotebookWrite[Flights from Charlotte to Ithaca on 2022-03-10]",
+    "Planner[Could you create a travel plan from Ithaca to Charlotte spanning 3 days?]",
+]
+
+
+def scripted_reply(messages: List[dict], script: List[str]) -> str:
+    """Answer a ReAct prompt with the scripted thought and/or action of the step it asks for, or a planner prompt with a plan."""
+    instruction = messages[-1]['content'] if messages else ''
+    if 'Given information:' in instruction:
+        return "Day 1:\nCurrent City: from Ithaca to Charlotte\nTransportation: -\nBreakfast: -\nAttraction: -\n" \
+               "Lunch: -\nDinner: -\nAccommodation: -"
+    match = re.search(r'number (\d+)', instruction)
+    step = int(match.group(1)) if match else 1
+    action = script[min(step, len(script)) - 1]
+    thought = f"Thought {step}: I should call {action.split('[')[0]} next."
+    if 'thought number' in instruction and 'action number' in instruction:
+        return f"{thought}\nAction {step}: {action}"
+    if 'action number' in instruction:
+        return f"Action {step}: {action}"
+    return thought
+
+
+class MockOllamaServer:
+    """Serve `/api/chat` with scripted replies and a configurable latency model.
+
+    Each call sleeps `latency` seconds plus `token_latency` per generated token; streaming
+    requests get one NDJSON chunk per token, followed by a final chunk with Ollama's counters.
+    """
+
+    def __init__(self, script: Optional[List[str]] = None, latency: float = 0.0, token_latency: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.script = script or DEFAULT_SCRIPT
+        self.latency = latency
+        self.token_latency = token_latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/chat"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Avoid delayed-ACK stalls between the header and body writes on keep-alive connections
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._send_json({"version": "mock"} if self.path == '/api/version' else {"models": []})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                mock.requests += 1
+                messages = request.get('messages', [])
+                options = request.get('options', {})
+                # An empty chat only loads the model, as done by the warm-up
+                content = scripted_reply(messages, mock.script) if messages else ''
+                done_reason = 'stop'
+                for stop in options.get('stop', []):
+                    if stop in content:
+                        content = content[:content.index(stop)]
+                tokens = re.findall(r'\S+\s*', content)
+                if len(tokens) > options.get('num_predict', len(tokens)):
+                    tokens, done_reason = tokens[:options['num_predict']], 'length'
+                    content = ''.join(tokens)
+                prompt_tokens = sum(len(message['content']) for message in messages) // 4
+                time.sleep(mock.latency)
+                final = {
+                    "model": request.get('model'), "done": True, "done_reason": done_reason,
+                    "prompt_eval_count": prompt_tokens, "eval_count": len(tokens),
+                    "prompt_eval_duration": int(mock.latency * 1e9),
+                    "eval_duration": int(len(tokens) * mock.token_latency * 1e9) or 1,
+                    "load_duration": 0,
+                }
+                if not request.get('stream', True):
+                    time.sleep(len(tokens) * mock.token_latency)
+                    self._send_json(dict(final, message={"role": "assistant", "content": content}))
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        time.sleep(mock.token_latency)
+                        self._send_chunk({"model": request.get('model'), "done": False,
+                                          "message": {"role": "assistant", "content": token}})
+                    self._send_chunk(dict(final, message={"role": "assistant", "content": ""}))
+                    self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading early, e.g. after an action was parsed
+                    self.close_connection = True
+
+            def _send_json(self, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunk(self, body):
+                data = (json.dumps(body) + '\n').encode('utf-8')
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockOllamaServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", default=11434, type=int)
+    parser.add_argument("--latency", default=0.0, type=float, help="seconds per call")
+    parser.add_argument("--token_latency", default=0.0, type=float, help="seconds per generated token")
+    args = parser.parse_args()
+    server = MockOllamaServer(latency=args.latency, token_latency=args.token_latency, port=args.port)
+    print(f"Mock Ollama listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,100 @@
+# Notebook of search results that serializes compactly for the planner
+from typing import Any, Dict, List, Optional, Tuple
+
+from observation import CompactEncoder, is_dataframe
+from tokens import count_tokens
+
+
+class CompactNotebook:
+    """Drop-in for the TravelPlanner notebook that deduplicates entries and caches their text.
+
+    Entries are keyed on the (tool, *args) of the search they record, so writing the same search twice
+    keeps one entry under the latest description. Each entry is encoded as a dense delimited table when
+    it is written; `serialize` joins the cached text and only re-encodes the largest tables when the
+    whole notebook exceeds `token_budget`.
+    """
+
+    def __init__(self, token_budget: Optional[int] = 4096, delimiter: str = '|'):
+        self.token_budget = token_budget
+        self.delimiter = delimiter
+        self._entries = []
+        self._index = {}
+
+    def _encode(self, content: Any, tool_name: Optional[str], token_budget: int) -> str:
+        # Every column is kept: the planner needs the fields the agent never sees, e.g. house rules and cities
+        return CompactEncoder(token_budget=token_budget, delimiter=self.delimiter,
+                              projections={}).encode(content, tool_name)
+
+    def _make_entry(self, content: Any, short_description: str, key: Optional[Tuple]) -> Dict[str, Any]:
+        text = self._encode(content, key[0] if key else None, self.token_budget or 1 << 30)
+        return {"Short Description": short_description, "Content": content, "key": key, "text": text,
+                "tokens": count_tokens(text) + count_tokens(short_description) + 4}
+
+    def write(self, input_data: Any, short_description: str, key: Optional[Tuple] = None) -> str:
+        if key is not None and key in self._index:
+            index = self._index[key]
+            entry = self._entries[index]
+            entry["tokens"] += count_tokens(short_description) - count_tokens(entry["Short Description"])
+            entry["Short Description"] = short_description
+            return f"The information has been recorded in Notebook, and its index is {index}."
+        if key is not None:
+            self._index[key] = len(self._entries)
+        self._entries.append(self._make_entry(input_data, short_description, key))
+        return f"The information has been recorded in Notebook, and its index is {len(self._entries) - 1}."
+
+    def update(self, input_data: Any, index: int, short_description: str) -> str:
+        key = self._entries[index]["key"]
+        self._entries[index] = self._make_entry(input_data, short_description, key)
+        return "The information has been updated in Notebook."
+
+    def list(self, index: int) -> Dict[str, Any]:
+        return {"index": index, "Short Description": self._entries[index]["Short Description"],
+                "Content": self._entries[index]["text"]}
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        return [self.list(index) for index in range(len(self._entries))]
+
+    def reset(self):
+        self._entries = []
+        self._index = {}
+
+    @property
+    def data(self) -> List[Dict[str, Any]]:
+        return self._entries
+
+    @data.setter
+    def data(self, entries: List[Dict[str, Any]]):
+        # Checkpoints round-trip the keys through JSON lists
+        self.reset()
+        for entry in entries:
+            key = tuple(entry["key"]) if entry.get("key") is not None else None
+            self._entries.append(dict(entry, key=key))
+            if key is not None:
+                self._index[key] = len(self._entries) - 1
+
+    def _allot(self) -> List[int]:
+        """Split the token budget over the entries, giving small entries all they need first."""
+        allotted = [entry["tokens"] for entry in self._entries]
+        remaining, left = self.token_budget, len(allotted)
+        for i in sorted(range(len(allotted)), key=lambda i: allotted[i]):
+            allotted[i] = min(allotted[i], remaining // left)
+            remaining -= allotted[i]
+            left -= 1
+        return allotted
+
+    def serialize(self) -> str:
+        """Return the dense planner input, bounded by the token budget."""
+        tokens = sum(entry["tokens"] for entry in self._entries)
+        if self.token_budget is None or tokens <= self.token_budget:
+            texts = [entry["text"] for entry in self._entries]
+        else:
+            texts = []
+            for entry, budget in zip(self._entries, self._allot()):
+                if budget < entry["tokens"] and is_dataframe(entry["Content"]):
+                    header = count_tokens(entry["Short Description"]) + 4
+                    texts.append(self._encode(entry["Content"], entry["key"][0] if entry["key"] else None,
+                                              max(budget - header, 0)))
+                else:
+                    texts.append(entry["text"])
+        return '\n'.join(f"[{index}] {entry['Short Description']}\n{text}"
+                         for index, (entry, text) in enumerate(zip(self._entries, texts)))
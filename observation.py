@@ -0,0 +1,77 @@
+# Encoders turning tool results into observation text for the agent
+from typing import Any, Dict, List, Optional
+import sys
+
+from tokens import count_tokens
+
+# Columns worth showing to the agent for each tool; the notebook still keeps the full tables
+DEFAULT_PROJECTIONS = {
+    "flights": ['Flight Number', 'Price', 'DepTime', 'ArrTime', 'ActualElapsedTime', 'Distance'],
+    "accommodations": ['NAME', 'price', 'room type', 'house_rules', 'minimum nights', 'maximum occupancy',
+                       'review rate number'],
+    "restaurants": ['Name', 'Average Cost', 'Cuisines', 'Aggregate Rating'],
+    "attractions": ['Name', 'Address'],
+}
+
+
+def is_dataframe(data: Any) -> bool:
+    """Check for a DataFrame without importing pandas; if pandas is not loaded, nothing is one."""
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(data, pandas.DataFrame)
+
+
+class TableEncoder:
+    """Padded full-width tables with every column and row, as produced by `DataFrame.to_string`."""
+
+    def encode(self, data: Any, tool_name: Optional[str] = None) -> str:
+        if data is not None:
+            if is_dataframe(data):
+                return data.to_string(index=False)
+            return str(data)
+        return "None"
+
+
+class CompactEncoder:
+    """Dense delimiter-separated tables with column projection, top-k rows and a token budget."""
+
+    def __init__(self, token_budget: int = 1024, top_k: Optional[int] = None, delimiter: str = '|',
+                 projections: Optional[Dict[str, List[str]]] = None):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.delimiter = delimiter
+        self.projections = DEFAULT_PROJECTIONS if projections is None else projections
+
+    def _line(self, values) -> str:
+        return self.delimiter.join(str(value).replace(self.delimiter, '/').replace('\n', ' ') for value in values)
+
+    def encode(self, data: Any, tool_name: Optional[str] = None) -> str:
+        if data is None:
+            return "None"
+        if not is_dataframe(data):
+            return str(data)
+
+        columns = [column for column in self.projections.get(tool_name, data.columns) if column in data.columns]
+        lines = [self._line(columns)]
+        used = count_tokens(lines[0])
+        limit = len(data) if self.top_k is None else min(self.top_k, len(data))
+        shown = 0
+        for row in data[columns].head(limit).itertuples(index=False):
+            line = self._line(row)
+            cost = count_tokens(line) + 1
+            if used + cost > self.token_budget:
+                break
+            lines.append(line)
+            used += cost
+            shown += 1
+        if shown < len(data):
+            lines.append(f"... {len(data) - shown} more rows")
+        return '\n'.join(lines)
+
+
+def get_encoder(name: str, **kwargs):
+    """Create an observation encoder by name."""
+    if name == 'table':
+        return TableEncoder()
+    if name == 'compact':
+        return CompactEncoder(**kwargs)
+    raise ValueError(f"Unknown observation format: {name}")
@@ -0,0 +1,34 @@
+# Planner stage run on its own model and endpoints, separate from the information gathering agents
+from typing import Optional
+
+from agent import OllamaAgent
+from cache import ResponseCache
+from generation import GenerationProfiles
+from metrics import Metrics
+from prompts import planner_agent_prompt
+from trace_writer import TraceWriter
+from transport import OllamaTransport
+
+
+class OllamaPlanner:
+    """Turns a finished notebook into a plan with one call to the planner model.
+
+    Has the same `run(text, query)` interface as the TravelPlanner planner tool, so it can be used
+    inline by an ActionHandler or by the planner workers of the pipelined runner.
+    """
+
+    def __init__(self, model: str, transport: OllamaTransport, prompt=planner_agent_prompt, stream: bool = False,
+                 cache: Optional[ResponseCache] = None, trace: Optional[TraceWriter] = None,
+                 metrics: Optional[Metrics] = None, generation: Optional[GenerationProfiles] = None,
+                 keep_alive=None):
+        self.prompt = prompt
+        self.generation = generation if generation is not None else GenerationProfiles()
+        self.llm = OllamaAgent(llama_url=transport.llama_url, model=model, stream=stream, messages=[],
+                               transport=transport, cache=cache, trace=trace, metrics=metrics, keep_alive=keep_alive)
+
+    def run(self, text: str, query: str, query_id=None) -> str:
+        """Return the plan for a query given the notebook contents."""
+        self.llm.messages = []
+        self.llm.trace_tags = {"query_id": query_id, "stage": "planner"}
+        self.llm.add_message("user", self.prompt.format(text=text, query=query))
+        return self.llm.send_query(options=self.generation.options('planner'))['message']['content']
@@ -0,0 +1,57 @@
+# Speculative tool lookups for the facts a query states up front
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Tuple
+
+from query_info import parse_query
+
+DISTANCE_MODES = ['self-driving', 'taxi']
+
+
+class Prefetcher:
+    """Runs the lookups an agent is likely to make for a query on a thread pool.
+
+    Results land in the handler's tool cache, so when the agent asks for them they are either
+    ready or already in flight. Failed lookups are dropped; the agent simply repeats them.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+
+    def plan(self, handler, query: str) -> List[Tuple]:
+        """Return the (tool, *args) lookups to prefetch for a query."""
+        info = parse_query(query)
+        origin = handler.city_set.resolve(info['origin'])[0] if info['origin'] else None
+        destination = handler.city_set.resolve(info['destination'])[0] if info['destination'] else None
+        lookups = []
+        if destination is None:
+            # Multi-city trips name a state; the agent starts by listing its cities
+            if info['destination']:
+                lookups.append(('cities', info['destination']))
+            return lookups
+
+        for tool in ('accommodations', 'restaurants', 'attractions'):
+            lookups.append((tool, destination))
+        if origin is not None:
+            if info['start_date']:
+                lookups.append(('flights', origin, destination, info['start_date']))
+            if info['end_date']:
+                lookups.append(('flights', destination, origin, info['end_date']))
+            for mode in DISTANCE_MODES:
+                lookups.append(('googleDistanceMatrix', origin, destination, mode))
+                lookups.append(('googleDistanceMatrix', destination, origin, mode))
+        return lookups
+
+    def prefetch(self, handler, query: str) -> List[Future]:
+        """Start the likely lookups for a query and return their futures."""
+        return [self.executor.submit(self._run, handler, tool, *args) for tool, *args in self.plan(handler, query)]
+
+    @staticmethod
+    def _run(handler, tool: str, *args):
+        try:
+            # Straight to the cache: the handler's current search belongs to the running agent
+            return handler.tool_cache.call(tool, handler.tools[tool].run, *args)
+        except Exception:
+            return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
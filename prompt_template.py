@@ -0,0 +1,27 @@
+# Minimal drop-in for langchain's PromptTemplate, which is all prompts.py needs
+from string import Formatter
+from typing import List
+
+
+class PromptTemplate:
+    """A str.format template parsed once at import time instead of on every `format` call."""
+
+    def __init__(self, input_variables: List[str], template: str):
+        self.input_variables = list(input_variables)
+        self.template = template
+        self._parts = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"Unsupported replacement field in template: {{{field}!{conversion}:{spec}}}")
+            self._parts.append((literal, field))
+        fields = {field for _, field in self._parts if field is not None}
+        if fields != set(self.input_variables):
+            raise ValueError(f"Template variables {sorted(fields)} do not match {sorted(self.input_variables)}")
+
+    def format(self, **kwargs) -> str:
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(kwargs[field]))
+        return ''.join(pieces)
@@ -0,0 +1,79 @@
+# Structured facts stated up front in a TravelPlanner query
+from datetime import date
+from typing import Dict, Any, List
+import re
+
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december']
+DEFAULT_YEAR = 2022
+
+_DATE = re.compile(r'\b(' + '|'.join(MONTHS) + r')\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?', re.I)
+# The origin cannot run past " and" or a route keyword into the rest of the sentence; the destination may
+# be a region, as in "to 3 cities in Texas"
+_ROUTE = re.compile(r'\bfrom\s+([A-Z](?:(?!\s(?:and|to|heading|going|traveling|travelling)\b)[\w.\' -])*?)\s+(?:and\s+)?(?:to|heading to|going to|traveling to|travelling to)\s+'
+                    r'(?:(?:\d+|one|two|three) (?:different )?cities in\s+)?([A-Z][\w.\' -]*?)'
+                    r'(?=\s*(?:,|\.|\?|;| spanning| for| from| over| between| during| on| in| with| starting| visiting|$))')
+_ORIGIN = re.compile(r'\b(?:begins|beginning|starts|starting|departing|leaving)\s+(?:in|from|at)\s+([A-Z][\w.\' -]*?)'
+                     r'(?=\s*(?:,|\.|\?|;| and| spanning| for| with|$))')
+_REGION = re.compile(r'\bcities\s+in\s+([A-Z][\w.\' -]*?)(?=\s*(?:,|\.|\?|;| and| spanning| for| from| over| between| during| on| with|$))')
+_DAYS = re.compile(r'(\d+)[- ]days?\b', re.I)
+_CITIES = re.compile(r'(\d+|one|two|three) (?:different )?cities', re.I)
+_BUDGET = re.compile(r'budget[^$\d]*\$?\s?([\d,]+)', re.I)
+_COUNT = r'(\d+|one|two|three|four|five|six|seven|eight|nine|ten)'
+# "3 people", "a group of 3", "a party of four", or a bare count ending the phrase: "a trip for two."
+_PEOPLE = re.compile(rf'\b{_COUNT} (?:people|persons|travelers|travellers|individuals)'
+                     rf'|\b(?:group|party) of {_COUNT}\b'
+                     rf'|\bfor {_COUNT}(?=\s*(?:,|\.|\?|;|!|$))', re.I)
+_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10}
+
+
+def _number(text: str) -> int:
+    return _WORDS.get(text.lower()) or int(text)
+
+
+def parse_dates(query: str) -> List[str]:
+    """Return the dates mentioned in the query as YYYY-MM-DD, in order of appearance."""
+    matches = _DATE.findall(query)
+    year = next((int(y) for _, _, y in matches if y), DEFAULT_YEAR)
+    dates = []
+    for month, day, explicit_year in matches:
+        try:
+            dates.append(date(int(explicit_year or year), MONTHS.index(month.lower()) + 1, int(day)).isoformat())
+        except ValueError:
+            continue
+    return dates
+
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """Extract origin, destination, dates, trip length, budget and party size where they are stated."""
+    route = next((match for match in _ROUTE.finditer(query)
+                  if not _DATE.match(match.group(1)) and not _DATE.match(match.group(2))), None)
+    origin = route.group(1).strip() if route else None
+    destination = route.group(2).strip() if route else None
+    if origin is None:
+        match = _ORIGIN.search(query)
+        origin = match.group(1).strip() if match else None
+    if destination is None:
+        match = _REGION.search(query)
+        destination = match.group(1).strip() if match else None
+    dates = parse_dates(query)
+    days = _DAYS.search(query)
+    cities = _CITIES.search(query)
+    budget = _BUDGET.search(query)
+    people = _PEOPLE.search(query)
+    if people is None and re.search(r'\b(single person|solo|myself|alone)\b', query, re.I):
+        people_number = 1
+    else:
+        people_number = _number(next(group for group in people.groups() if group)) if people else None
+    return {
+        "origin": origin,
+        "destination": destination,
+        "dates": dates,
+        "start_date": dates[0] if dates else None,
+        "end_date": dates[-1] if dates else None,
+        "days": int(days.group(1)) if days else None,
+        "visiting_city_number": _number(cities.group(1)) if cities else 1,
+        "budget": int(budget.group(1).replace(',', '')) if budget else None,
+        "people_number": people_number,
+    }
+
@@ -0,0 +1,144 @@
+# Sharding of a split over several runs, the completed-query index and merging of shard outputs
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+INDEX_PATTERN = 'completed_*.jsonl'
+
+
+def in_shard(number: int, num_shards: int, shard_index: int) -> bool:
+    """Assign query numbers to shards round-robin, the same way on every machine."""
+    return (number - 1) % num_shards == shard_index
+
+
+def shard_jobs(jobs: Iterable[Tuple[int, str]], num_shards: int, shard_index: int) -> Iterator[Tuple[int, str]]:
+    """Keep the (number, query) jobs that belong to a shard."""
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} is not in [0, {num_shards})")
+    return ((number, query) for number, query in jobs if in_shard(number, num_shards, shard_index))
+
+
+class CompletedIndex:
+    """Append-only record of the queries whose plan files have been written, one JSONL file per shard.
+
+    Every shard's file in the output directory is read at startup, so work finished under any sharding
+    is skipped without opening the plan files.
+    """
+
+    def __init__(self, output_path: str, model_name: str, shard_name: str = '0-of-1'):
+        self.model_name = model_name
+        self.path = os.path.join(output_path, f'completed_{shard_name}.jsonl')
+        self._lock = threading.Lock()
+        self.numbers = load_completed(output_path, model_name)
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def add(self, number: int):
+        """Record a finished query."""
+        line = json.dumps({"number": number, "model": self.model_name, "time": time.time()}) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.numbers.add(number)
+
+
+def load_completed(output_path: str, model_name: str) -> Set[int]:
+    """Read the query numbers finished by a model from every index file in an output directory."""
+    numbers = set()
+    for path in glob.glob(os.path.join(output_path, INDEX_PATTERN)):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a partial last line
+                    continue
+                if record.get('model') == model_name:
+                    numbers.add(record['number'])
+    return numbers
+
+
+def validate_plan(path: str, model_name: str) -> Optional[str]:
+    """Return why a plan file is not a usable result for the model, or None when it is."""
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+    except (OSError, ValueError) as e:
+        return f"unreadable: {e}"
+    if not isinstance(result, list) or not result or not isinstance(result[-1], dict):
+        return "not a list of result records"
+    if f'{model_name}_two-stage_results' not in result[-1]:
+        return f"no {model_name} results"
+    return None
+
+
+def merge_shards(shard_dirs: List[str], merged_dir: str, model_name: str,
+                 expected: Optional[int] = None) -> Dict[str, Any]:
+    """Validate the plan files of every shard output directory and copy them into one directory.
+
+    A query found in several shards keeps its most recently written plan. Returns a report of the
+    merged, invalid, duplicated and missing query numbers, which is also written as `merge_report.json`.
+    """
+    found = {}
+    invalid, duplicates = {}, []
+    for shard_dir in shard_dirs:
+        for path in glob.glob(os.path.join(shard_dir, 'generated_plan_*.json')):
+            number = int(re.search(r'generated_plan_(\d+)\.json$', path).group(1))
+            error = validate_plan(path, model_name)
+            if error is not None:
+                invalid[path] = error
+                continue
+            if number in found:
+                duplicates.append(number)
+                if os.path.getmtime(path) <= os.path.getmtime(found[number]):
+                    continue
+            found[number] = path
+
+    os.makedirs(merged_dir, exist_ok=True)
+    for number, path in sorted(found.items()):
+        shutil.copyfile(path, os.path.join(merged_dir, f'generated_plan_{number}.json'))
+    total = expected if expected is not None else max(found, default=0)
+    report = {
+        "model": model_name,
+        "shards": shard_dirs,
+        "merged": len(found),
+        "expected": total,
+        "missing": [number for number in range(1, total + 1) if number not in found],
+        "duplicates": sorted(set(duplicates)),
+        "invalid": invalid,
+    }
+    with open(os.path.join(merged_dir, 'merge_report.json'), 'w') as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Validate and merge the outputs of sharded runs")
+    parser.add_argument("shard_dirs", nargs='+', help="the <output_dir>/<set_type> directory of every shard")
+    parser.add_argument("--merged_dir", required=True, type=str)
+    parser.add_argument("--model_name", default="llama3:8b-instruct-fp16", type=str)
+    parser.add_argument("--expected", default=None, type=int, help="number of queries in the split")
+    parser.add_argument("--allow_missing", default=False, action='store_true',
+                        help="exit successfully even when queries are missing or invalid")
+    args = parser.parse_args()
+
+    report = merge_shards(args.shard_dirs, args.merged_dir, args.model_name, args.expected)
+    print(f"Merged {report['merged']} of {report['expected']} queries into {args.merged_dir}")
+    if report['duplicates']:
+        print(f"{len(report['duplicates'])} queries were run by several shards, kept the latest: {report['duplicates']}")
+    for path, error in report['invalid'].items():
+        print(f"Invalid plan file {path}: {error}")
+    if report['missing']:
+        print(f"{len(report['missing'])} queries missing: {report['missing']}")
+    if (report['missing'] or report['invalid']) and not args.allow_missing:
+        raise SystemExit(1)
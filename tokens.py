@@ -0,0 +1,29 @@
+# Token counting used for prompt budgets
+from typing import Dict, Any, List
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # No tokenizer available offline, fall back to the usual ~4 characters per token estimate
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a piece of text."""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Count the tokens of a chat message list, including a small per-message overhead."""
+    return sum(count_tokens(message['content']) + 4 for message in messages)
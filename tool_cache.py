@@ -0,0 +1,65 @@
+# Process-wide memoization of tool results shared by every ActionHandler
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+import threading
+
+
+class ToolCache:
+    """Thread-safe LRU cache of tool results keyed on the tool name and its exact arguments.
+
+    The tools are case-sensitive, so callers pass canonical arguments, e.g. cities resolved through the
+    city index. Concurrent requests for the same key wait for the first caller instead of running the tool twice.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(tool_name: str, args: Tuple) -> Tuple:
+        return (tool_name,) + tuple(args)
+
+    def call(self, tool_name: str, func: Callable, *args) -> Any:
+        """Return the memoized result of `func(*args)`, running it on a miss."""
+        key = self.key(tool_name, args)
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                pending = None
+            else:
+                self.misses += 1
+                future = pending = Future()
+                self._entries[key] = future
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if pending is None:
+            return future.result()
+
+        try:
+            pending.set_result(func(*args))
+        except Exception as e:
+            # Failures are not memoized, callers already waiting get the same exception
+            with self._lock:
+                if self._entries.get(key) is pending:
+                    del self._entries[key]
+            pending.set_exception(e)
+        return pending.result()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+shared_tool_cache = ToolCache()
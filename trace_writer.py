@@ -0,0 +1,71 @@
+# Append-only JSONL trace of every LLM request and response, written off the hot path
+from typing import Dict, Any, Optional
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+_CLOSE = object()
+
+
+class TraceWriter:
+    """Background writer appending trace records to a JSONL (optionally gzip) file.
+
+    `write` only enqueues the record; a daemon thread writes them in batches, flushes after
+    every batch and fsyncs at most every `fsync_interval` seconds. Safe to share between agents.
+    """
+
+    def __init__(self, path: str, compress: Optional[bool] = None, batch_size: int = 64,
+                 fsync_interval: float = 5.0):
+        self.path = path
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._queue = queue.Queue()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._raw = open(path, 'ab')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='ab') if self.compress else self._raw
+        self._last_fsync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict[str, Any]):
+        """Queue a record for writing."""
+        self._queue.put(record)
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(record is _CLOSE for record in batch):
+                closing = True
+                batch = [record for record in batch if record is not _CLOSE]
+            lines = [json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in batch]
+            self._file.write(''.join(lines).encode('utf-8'))
+            self.records += len(lines)
+            self._flush(force=closing)
+
+    def _flush(self, force: bool = False):
+        self._file.flush()
+        if self._file is not self._raw:
+            self._raw.flush()
+        if force or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._raw.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        """Write the queued records, fsync and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
@@ -0,0 +1,90 @@
+# HTTP transport shared by the Ollama agents
+from typing import Dict, Any, Iterator, Optional
+import json
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OllamaTransport:
+    """Pooled HTTP transport for the Ollama chat endpoint.
+
+    A single transport keeps its connections alive between calls, so it should be
+    shared by every agent that talks to the same server.
+    """
+
+    def __init__(self, llama_url: str, pool_maxsize: int = 16, connect_timeout: float = 5.0,
+                 read_timeout: Optional[float] = 600.0):
+        self.llama_url = llama_url
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._session = None
+        self._async_session = None
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def session(self) -> requests.Session:
+        """Lazily create the keep-alive session and its connection pool."""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def post(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request over the pooled session and return the decoded response."""
+        response = self.session.post(self.llama_url, json=request, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Send a streaming request and yield each NDJSON chunk as it arrives.
+
+        Closing the generator closes the underlying response, which stops the server
+        from generating any further tokens for this request.
+        """
+        with self.session.post(self.llama_url, json=request, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def warm_up(self, model: str, keep_alive=None) -> float:
+        """Load a model ahead of the first query with an empty chat request and return the seconds it took."""
+        request = {"model": model, "messages": [], "stream": False}
+        if keep_alive is not None:
+            request["keep_alive"] = keep_alive
+        started = time.perf_counter()
+        self.post(request)
+        return time.perf_counter() - started
+
+    async def apost(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of `post`; all callers on one event loop share a connection pool."""
+        import aiohttp
+
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                timeout=aiohttp.ClientTimeout(connect=self.connect_timeout, sock_read=self.read_timeout))
+        async with self._async_session.post(self.llama_url, json=request) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    def close(self):
+        """Release the pooled connections of the sync session."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        """Release the pooled connections of the async session."""
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
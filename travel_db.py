@@ -0,0 +1,301 @@
+# Indexed columnar store for the travel database and the query engine behind the search tools
+from typing import Dict, Any, List, Tuple
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+KEY_SEPARATOR = '\x1f'
+
+# Table layouts of the tools.<name>.apis classes: source CSV, kept columns, lookup key and empty-result message
+TABLES = {
+    "flights": {
+        "csv": "flights/clean_Flights_2022.csv",
+        "columns": ['Flight Number', 'Price', 'DepTime', 'ArrTime', 'ActualElapsedTime', 'FlightDate',
+                    'OriginCityName', 'DestCityName', 'Distance'],
+        "key": ['OriginCityName', 'DestCityName', 'FlightDate'],
+        "empty": "There is no flight from {} to {} on {}.",
+    },
+    "accommodations": {
+        "csv": "accommodations/clean_accommodations_2022.csv",
+        "columns": ['NAME', 'price', 'room type', 'house_rules', 'minimum nights', 'maximum occupancy',
+                    'review rate number', 'city'],
+        "key": ['city'],
+        "empty": "There is no attraction in this city.",
+    },
+    "restaurants": {
+        "csv": "restaurants/clean_restaurant_2022.csv",
+        "columns": ['Name', 'Average Cost', 'Cuisines', 'Aggregate Rating', 'City'],
+        "key": ['City'],
+        "empty": "There is no restaurant in this city.",
+    },
+    "attractions": {
+        "csv": "attractions/attractions.csv",
+        "columns": ['Name', 'Latitude', 'Longitude', 'Address', 'Phone', 'Website', 'City'],
+        "key": ['City'],
+        "empty": "There is no attraction in this city.",
+    },
+}
+
+DISTANCE_CSV = "googleDistanceMatrix/distance.csv"
+CITY_SET = "background/citySet.txt"
+# Cost per km of each travel mode, as charged by the GoogleDistanceMatrix tool
+DISTANCE_MODES = {"self-driving": 0.05, "taxi": 1}
+
+
+def build_table(csv_path: str, table_dir: str, columns: List[str], key: List[str]):
+    """Compile one CSV into per-column .npy files, sorted by key, plus a hash index of key ranges."""
+    data = pd.read_csv(csv_path).dropna()[columns]
+    data = data.sort_values(key, kind='stable').reset_index(drop=True)
+    os.makedirs(table_dir, exist_ok=True)
+
+    kinds = []
+    for i, column in enumerate(columns):
+        values = data[column]
+        if pd.api.types.is_numeric_dtype(values):
+            np.save(os.path.join(table_dir, f'{i}.npy'), values.to_numpy())
+            kinds.append('numeric')
+        else:
+            # Strings are stored as one UTF-8 buffer plus row offsets so both files can be memory-mapped
+            encoded = [str(value).encode('utf-8') for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            np.save(os.path.join(table_dir, f'{i}.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            np.save(os.path.join(table_dir, f'{i}.offsets.npy'), offsets)
+            kinds.append('string')
+
+    index = {}
+    key_values = data[key].astype(str).agg(KEY_SEPARATOR.join, axis=1) if len(data) else []
+    for row, value in enumerate(key_values):
+        if value in index:
+            index[value][1] = row + 1
+        else:
+            index[value] = [row, row + 1]
+
+    with open(os.path.join(table_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({"columns": columns, "kinds": kinds, "key": key, "rows": len(data), "index": index}, f,
+                  ensure_ascii=False)
+
+
+def parse_duration(text: str) -> float:
+    """Minutes of a Google duration such as "2 hours 5 mins"; -1 for trips of a day or more."""
+    if 'day' in text:
+        return -1
+    hours = re.search(r'(\d+)\s*hour', text)
+    minutes = re.search(r'(\d+)\s*min', text)
+    return (int(hours.group(1)) if hours else 0) * 60 + (int(minutes.group(1)) if minutes else 0)
+
+
+def format_duration(minutes: float) -> str:
+    hours, minutes = divmod(int(minutes), 60)
+    parts = [f"{hours} hour{'s' if hours != 1 else ''}"] if hours else []
+    if minutes or not hours:
+        parts.append(f"{minutes} min{'s' if minutes != 1 else ''}")
+    return ' '.join(parts)
+
+
+def parse_distance(text: str) -> float:
+    return float(text.replace('km', '').replace(',', '').strip())
+
+
+def build_distance_matrix(csv_path: str, city_set_path: str, matrix_dir: str):
+    """Precompute distance, duration and the cost of every mode for all city pairs as dense arrays.
+
+    Cities are numbered in the order of the city set. Missing pairs are NaN (cost -1); pairs that
+    exist without a usable route have a duration of -1.
+    """
+    with open(city_set_path, 'r', encoding='utf-8') as f:
+        cities = [city for city in f.read().strip().split('\n') if city]
+    city_ids = {city: i for i, city in enumerate(cities)}
+    size = len(cities)
+    distance = np.full((size, size), np.nan, dtype=np.float32)
+    duration = np.full((size, size), np.nan, dtype=np.float32)
+    cost = np.full((len(DISTANCE_MODES), size, size), -1, dtype=np.int32)
+
+    data = pd.read_csv(csv_path)
+    for origin, destination, duration_text, distance_text in zip(data['origin'], data['destination'],
+                                                                  data['duration'], data['distance']):
+        i, j = city_ids.get(origin), city_ids.get(destination)
+        if i is None or j is None:
+            continue
+        if not isinstance(duration_text, str) or not isinstance(distance_text, str):
+            duration[i, j] = -1
+            continue
+        duration[i, j] = parse_duration(duration_text)
+        km = parse_distance(distance_text)
+        distance[i, j] = km
+        for mode, rate in enumerate(DISTANCE_MODES.values()):
+            cost[mode, i, j] = int(km * rate)
+
+    os.makedirs(matrix_dir, exist_ok=True)
+    np.save(os.path.join(matrix_dir, 'distance.npy'), distance)
+    np.save(os.path.join(matrix_dir, 'duration.npy'), duration)
+    np.save(os.path.join(matrix_dir, 'cost.npy'), cost)
+    with open(os.path.join(matrix_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({"cities": cities, "modes": list(DISTANCE_MODES)}, f, ensure_ascii=False)
+
+
+def build_database(database_dir: str, store_dir: str):
+    """Compile every table of the travel database into the indexed store."""
+    for name, table in TABLES.items():
+        print(f"Building {name}")
+        build_table(os.path.join(database_dir, table["csv"]), os.path.join(store_dir, name),
+                    table["columns"], table["key"])
+    print("Building googleDistanceMatrix")
+    build_distance_matrix(os.path.join(database_dir, DISTANCE_CSV), os.path.join(database_dir, CITY_SET),
+                          os.path.join(store_dir, DistanceMatrix.name))
+
+
+class IndexedTable:
+    """Read-only view of one compiled table; columns are memory-mapped and shared between processes."""
+
+    def __init__(self, table_dir: str):
+        with open(os.path.join(table_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.key = meta["key"]
+        self.index: Dict[str, Tuple[int, int]] = meta["index"]
+        self._data = []
+        for i, kind in enumerate(meta["kinds"]):
+            values = np.load(os.path.join(table_dir, f'{i}.npy'), mmap_mode='r')
+            offsets = np.load(os.path.join(table_dir, f'{i}.offsets.npy'), mmap_mode='r') if kind == 'string' else None
+            self._data.append((values, offsets))
+
+    def lookup(self, *key: Any) -> pd.DataFrame:
+        """Return the rows matching the key with a single index probe."""
+        start, stop = self.index.get(KEY_SEPARATOR.join(str(part) for part in key), (0, 0))
+        frame = {}
+        for column, (values, offsets) in zip(self.columns, self._data):
+            if offsets is None:
+                frame[column] = np.array(values[start:stop])
+            else:
+                frame[column] = [values[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+                                 for row in range(start, stop)]
+        return pd.DataFrame(frame, columns=self.columns)
+
+
+class _IndexedTool:
+    name = None
+
+    def __init__(self, path: str = "../database/indexed"):
+        self.table = IndexedTable(os.path.join(path, self.name))
+
+    def _run(self, *key: Any):
+        results = self.table.lookup(*key)
+        if len(results) == 0:
+            return TABLES[self.name]["empty"].format(*key)
+        return results
+
+
+class Flights(_IndexedTool):
+    name = "flights"
+
+    def run(self, origin: str, destination: str, departure_date: str):
+        """Search for flights by origin, destination, and departure date."""
+        return self._run(origin, destination, departure_date)
+
+
+class Accommodations(_IndexedTool):
+    name = "accommodations"
+
+    def run(self, city: str):
+        """Search for accommodations by city."""
+        return self._run(city)
+
+
+class Restaurants(_IndexedTool):
+    name = "restaurants"
+
+    def run(self, city: str):
+        """Search for restaurants by city."""
+        return self._run(city)
+
+
+class Attractions(_IndexedTool):
+    name = "attractions"
+
+    def run(self, city: str):
+        """Search for attractions by city."""
+        return self._run(city)
+
+
+class DistanceMatrix:
+    """GoogleDistanceMatrix over the precomputed city-pair arrays; every lookup is an array read."""
+    name = "googleDistanceMatrix"
+
+    def __init__(self, path: str = "../database/indexed"):
+        matrix_dir = os.path.join(path, self.name)
+        with open(os.path.join(matrix_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.cities = meta["cities"]
+        self.city_ids = {city: i for i, city in enumerate(self.cities)}
+        self.modes = {mode: i for i, mode in enumerate(meta["modes"])}
+        self.distance = np.load(os.path.join(matrix_dir, 'distance.npy'), mmap_mode='r')
+        self.duration = np.load(os.path.join(matrix_dir, 'duration.npy'), mmap_mode='r')
+        self.cost = np.load(os.path.join(matrix_dir, 'cost.npy'), mmap_mode='r')
+
+    def _city_id(self, city: str) -> int:
+        # The agent sometimes passes "City(State)"
+        return self.city_ids.get(city.split('(')[0].strip(), -1)
+
+    def _mode(self, mode: str) -> int:
+        if 'driving' in mode:
+            return self.modes['self-driving']
+        return self.modes.get(mode, -1)
+
+    def lookup(self, origins: List[str], destinations: List[str], mode: str) -> Dict[str, np.ndarray]:
+        """Distance (km), duration (minutes) and cost of many pairs with one fancy-indexed read per array.
+
+        Unknown cities and missing pairs are NaN, cost -1; a duration of -1 marks a pair without a route.
+        """
+        i = np.array([self._city_id(city) for city in origins], dtype=np.int64)
+        j = np.array([self._city_id(city) for city in destinations], dtype=np.int64)
+        known = (i >= 0) & (j >= 0)
+        i, j = np.where(known, i, 0), np.where(known, j, 0)
+        distance = np.where(known, self.distance[i, j], np.nan)
+        duration = np.where(known, self.duration[i, j], np.nan)
+        mode_id = self._mode(mode)
+        cost = np.where(known, self.cost[mode_id, i, j], -1) if mode_id >= 0 else np.full(len(i), -1)
+        return {"distance": distance, "duration": duration, "cost": cost}
+
+    def itinerary(self, cities: List[str], mode: str) -> Dict[str, np.ndarray]:
+        """Legs of a route visiting `cities` in order, e.g. a multi-city trip and the way home."""
+        return self.lookup(cities[:-1], cities[1:], mode)
+
+    def _describe(self, origin: str, destination: str, mode: str, distance: float, duration: float,
+                  cost: int) -> str:
+        if np.isnan(duration):
+            return f"{mode}, from {origin} to {destination}, no valid information."
+        if duration < 0:
+            return "No valid information."
+        cost = None if cost < 0 else int(cost)
+        return f"{mode}, from {origin} to {destination}, duration: {format_duration(duration)}, " \
+               f"distance: {distance:,g} km, cost: {cost}"
+
+    def run_batch(self, pairs: List[Tuple[str, str]], mode: str) -> List[str]:
+        """Answer many (origin, destination) requests of one mode."""
+        if not pairs:
+            return []
+        origins, destinations = (list(cities) for cities in zip(*pairs))
+        legs = self.lookup(origins, destinations, mode)
+        return [self._describe(origin, destination, mode, *values)
+                for origin, destination, *values in zip(origins, destinations, legs["distance"],
+                                                         legs["duration"], legs["cost"])]
+
+    def run(self, origin: str, destination: str, mode: str = 'driving') -> str:
+        """Look up the distance, duration and cost of travelling between two cities."""
+        return self.run_batch([(origin, destination)], mode)[0]
+
+
+INDEXED_TOOLS = {tool.name: tool for tool in (Flights, Accommodations, Restaurants, Attractions, DistanceMatrix)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database_dir", default="../database", type=str)
+    parser.add_argument("--store_dir", default="../database/indexed", type=str)
+    args = parser.parse_args()
+    build_database(args.database_dir, args.store_dir)
@@ -1,16 +1,34 @@
 import importlib
+import itertools
 import os
 import sys
 import json
 import re
 import argparse
-from typing import List, Dict, Any
-from pandas import DataFrame
-from tqdm import tqdm
-from datasets import load_dataset
+import queue
+import threading
+import time
+from collections import ChainMap
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple
 
 from ReAct import ReActFramework
 from prompts import zeroshot_react_agent_prompt
+from cache import ResponseCache
+from checkpoint import CheckpointStore
+from city_index import CityIndex
+from generation import GenerationProfiles
+from metrics import Metrics
+from notebook import CompactNotebook
+from planner import OllamaPlanner
+from prefetch import Prefetcher
+from shards import CompletedIndex, shard_jobs
+from observation import TableEncoder, get_encoder
+from tool_cache import ToolCache, shared_tool_cache
+from tokens import count_tokens
+from trace_writer import TraceWriter
+from endpoint_pool import EndpointPool
 
 # Update system path to include necessary directories
 sys.path.extend([
@@ -44,91 +62,236 @@ class CityError(Exception):
 class DateError(Exception):
     pass
 
+class LazyTools(Mapping):
+    """Read-only map of tools that constructs each tool the first time it is used."""
+
+    def __init__(self, loader: Callable[[List[str]], Dict[str, Any]], names: List[str]):
+        self._loader = loader
+        self._names = list(names)
+        self._tools = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str):
+        if name not in self._names:
+            raise KeyError(name)
+        tool = self._tools.get(name)
+        if tool is None:
+            with self._lock:
+                if name not in self._tools:
+                    self._tools[name] = self._loader([name])[name]
+                tool = self._tools[name]
+        return tool
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
 class ActionHandler:
     tools_list = ["notebook", "flights", "attractions", "accommodations", "restaurants", "googleDistanceMatrix",
                   "planner", "cities"]
 
-    def __init__(self):
-        self.city_set = self.load_city('../database/background/citySet.txt')
-        self.tools = self.load_tools(tools=self.tools_list)
+    def __init__(self, shared_tools: Optional[Dict[str, Any]] = None, city_set: Optional[Iterable[str]] = None,
+                 tool_cache: ToolCache = shared_tool_cache, store_dir: Optional[str] = None, encoder=None,
+                 defer_planner: bool = False, notebook_format: str = 'list', notebook_tokens: Optional[int] = 4096,
+                 constraint_filter: bool = False):
+        if notebook_format not in ('list', 'compact'):
+            raise ValueError(f"Unknown notebook format: {notebook_format}")
+        self.notebook_format = notebook_format
+        self.notebook_tokens = notebook_tokens
+        # Drop search results that break the query's constraints before the agent sees them
+        self.constraint_filter = constraint_filter
+        self.tool_cache = tool_cache
+        # In the pipelined runner the Planner action only hands the notebook over to a planner worker
+        self.defer_planner = defer_planner
+        self.encoder = encoder if encoder is not None else TableEncoder()
+        self.store_dir = store_dir
+        if city_set is None:
+            city_set = self.load_city('../database/background/citySet.txt')
+        self.city_set = city_set if isinstance(city_set, CityIndex) else CityIndex(city_set)
+        self.corrections = []
+        # The search tools are read-only and can be shared between handlers; the notebook is per handler
+        if shared_tools is None:
+            shared_tools = LazyTools(self.load_tools, [name for name in self.tools_list if name != 'notebook'])
+        self.shared_tools = shared_tools
+        self.tools = ChainMap({}, shared_tools)
+        self.reset()
+
+    def reset(self):
+        """Start a fresh notebook and clear the per-query state."""
+        self.tools['notebook'] = self.new_notebook()
+        self.current_data = None
+        self.current_key = None
+        self.current_observation = ''
+        self.answer = ''
+        self.planner_input = None
+        self.filter = None
+        self.filter_note = None
+
+    def set_query(self, query: str):
+        """Read the constraints of the query being run, when constraint filtering is enabled."""
+        if self.constraint_filter:
+            from constraints import ConstraintFilter
+            self.filter = ConstraintFilter.from_query(query)
+
+    def get_state(self) -> Dict[str, Any]:
+        """Return the notebook and the per-query state for a checkpoint."""
+        return {"notebook": self.tools['notebook'].data, "current_data": self.current_data,
+                "current_key": self.current_key, "answer": self.answer, "planner_input": self.planner_input}
+
+    def set_state(self, state: Dict[str, Any]):
+        """Restore a state returned by `get_state`."""
+        self.tools['notebook'].data = list(state['notebook'])
+        self.current_data = state['current_data']
+        self.current_key = tuple(state['current_key']) if state.get('current_key') is not None else None
+        self.answer = state['answer']
+        self.planner_input = tuple(state['planner_input']) if state['planner_input'] is not None else None
 
     def handle_flightsearch(self, args: str):
         """Handle the FlightSearch action."""
         from_city, to_city, date = args.split(', ')
         if not validate_date_format(date):
             raise DateError(f"Invalid date format: {date}")
-        if from_city not in self.city_set or to_city not in self.city_set:
-            raise CityError(f"Invalid cities: {from_city}, {to_city}")
-        self.current_data = self.tools['flights'].run(from_city, to_city, date)
-        self.current_observation = to_string(self.current_data)
+        from_city, to_city = self.resolve_cities(from_city, to_city)
+        self.current_key = ('flights', from_city, to_city, date)
+        self.filter_note = None
+        self.current_data = self.constrain('flights', self.run_tool('flights', from_city, to_city, date))
+        self.current_observation = self.with_corrections(self.encoder.encode(self.current_data, 'flights'))
         return 'Successful'
 
     def handle_attractionsearch(self, args: str):
         """Handle the AttractionSearch action."""
-        city = args.strip()
-        if city not in self.city_set:
-            raise CityError(f"Invalid city: {city}")
-        self.current_data = self.tools['attractions'].run(city)
-        self.current_observation = to_string(self.current_data)
+        city, = self.resolve_cities(args.strip())
+        self.current_key = ('attractions', city)
+        self.filter_note = None
+        self.current_data = self.run_tool('attractions', city)
+        self.current_observation = self.with_corrections(self.encoder.encode(self.current_data, 'attractions'))
         return 'Successful'
 
     def handle_accommodationsearch(self, args: str):
         """Handle the AccommodationSearch action."""
-        city = args.strip()
-        if city not in self.city_set:
-            raise CityError(f"Invalid city: {city}")
-        self.current_data = self.tools['accommodations'].run(city)
-        self.current_observation = to_string(self.current_data)
+        city, = self.resolve_cities(args.strip())
+        self.current_key = ('accommodations', city)
+        self.filter_note = None
+        self.current_data = self.constrain('accommodations', self.run_tool('accommodations', city))
+        self.current_observation = self.with_corrections(self.encoder.encode(self.current_data, 'accommodations'))
         return 'Successful'
 
     def handle_restaurantsearch(self, args: str):
         """Handle the RestaurantSearch action."""
-        city = args.strip()
-        if city not in self.city_set:
-            raise CityError(f"Invalid city: {city}")
-        self.current_data = self.tools['restaurants'].run(city)
-        self.current_observation = to_string(self.current_data)
+        city, = self.resolve_cities(args.strip())
+        self.current_key = ('restaurants', city)
+        self.filter_note = None
+        self.current_data = self.constrain('restaurants', self.run_tool('restaurants', city))
+        self.current_observation = self.with_corrections(self.encoder.encode(self.current_data, 'restaurants'))
         return 'Successful'
 
     def handle_citysearch(self, args: str):
         """Handle the CitySearch action."""
         state = args.strip()
-        self.current_data = self.tools['cities'].run(state)
-        self.current_observation = to_string(self.current_data)
+        self.current_key = ('cities', state)
+        self.filter_note = None
+        self.current_data = self.run_tool('cities', state)
+        self.current_observation = self.encoder.encode(self.current_data, 'cities')
         return 'Successful'
 
     def handle_googledistancematrix(self, args: str):
         """Handle the GoogleDistanceMatrix action."""
         origin, destination, mode = args.split(', ')
-        self.current_data = self.tools['googleDistanceMatrix'].run(origin, destination, mode)
-        self.current_observation = to_string(self.current_data)
+        self.current_key = ('googleDistanceMatrix', origin, destination, mode)
+        self.filter_note = None
+        self.current_data = self.run_tool('googleDistanceMatrix', origin, destination, mode)
+        self.current_observation = self.encoder.encode(self.current_data, 'googleDistanceMatrix')
         return 'Successful'
 
     def handle_notebookwrite(self, args: str):
         """Handle the NotebookWrite action."""
         print("writing to notebook")
-        self.current_observation = str(self.tools['notebook'].write(self.current_data, args))
+        if self.notebook_format == 'compact':
+            self.current_observation = str(self.tools['notebook'].write(self.current_data, args, key=self.current_key))
+        else:
+            self.current_observation = str(self.tools['notebook'].write(self.current_data, args))
         return 'Successful'
 
     def handle_planner(self, args: str):
         """Handle the Planner action."""
-        self.current_observation = str(self.tools['planner'].run(str(self.tools['notebook'].list_all()), args))
+        if self.defer_planner:
+            self.planner_input = (self.notebook_text(), args)
+            self.current_observation = 'The notebook has been handed over to the planner.'
+            self.answer = ''
+            return 'Successful'
+        self.current_observation = str(self.tools['planner'].run(self.notebook_text(), args))
         self.answer = self.current_observation
         return 'Successful'
 
+    def notebook_text(self) -> str:
+        """Serialize the notebook as planner input and report its size."""
+        notebook = self.tools['notebook']
+        text = notebook.serialize() if self.notebook_format == 'compact' else str(notebook.list_all())
+        print(f"Planner input: {len(notebook.data)} notebook entries, {len(text)} characters, "
+              f"{count_tokens(text)} tokens")
+        return text
+
+    def resolve_cities(self, *cities: str) -> List[str]:
+        """Map city names to valid cities, auto-correcting confident matches and suggesting the rest."""
+        resolved, invalid, self.corrections = [], [], []
+        for city in cities:
+            match, suggestions = self.city_set.resolve(city)
+            if match is None:
+                invalid.append(f"{city} (did you mean: {', '.join(suggestions)}?)" if suggestions else city)
+            elif match != city:
+                self.corrections.append(f"'{city}' was read as '{match}'")
+            resolved.append(match)
+        if invalid:
+            raise CityError(f"Invalid {'city' if len(cities) == 1 else 'cities'}: {', '.join(invalid)}")
+        return resolved
+
+    def with_corrections(self, observation: str) -> str:
+        """Prefix an observation with the city corrections and filtering done for its action."""
+        notes = self.corrections + ([self.filter_note] if self.filter_note else [])
+        if not notes:
+            return observation
+        return f"Note: {'; '.join(notes)}.\n{observation}"
+
+    def constrain(self, tool_name: str, data):
+        """Filter and rank a search result by the query's constraints."""
+        if self.filter is None:
+            return data
+        data, dropped = self.filter.apply(data, tool_name)
+        if dropped:
+            self.filter_note = f"{dropped} results that break the query's budget, stay or room constraints are hidden"
+        return data
+
+    def run_tool(self, tool_name: str, *args):
+        """Run a search tool through the shared tool cache."""
+        return self.tool_cache.call(tool_name, self.tools[tool_name].run, *args)
+
     def load_tools(self, tools: List[str]) -> Dict[str, Any]:
         """Load the tools specified in the tools list."""
         tools_map = {}
+        if self.store_dir is not None:
+            from travel_db import INDEXED_TOOLS
         for tool_name in tools:
+            if self.store_dir is not None and tool_name in INDEXED_TOOLS:
+                tools_map[tool_name] = INDEXED_TOOLS[tool_name](self.store_dir)
+                continue
             module = importlib.import_module(f"tools.{tool_name}.apis")
             tool_class = getattr(module, tool_name[0].upper() + tool_name[1:])
             tools_map[tool_name] = tool_class()
         return tools_map
 
-    def load_city(self, city_set_path: str) -> List[str]:
-        """Load the list of valid cities from a file."""
+    def new_notebook(self):
+        """Create an empty notebook in the configured format."""
+        if self.notebook_format == 'compact':
+            return CompactNotebook(self.notebook_tokens)
+        return self.load_tools(tools=['notebook'])['notebook']
+
+    def load_city(self, city_set_path: str) -> CityIndex:
+        """Load the valid cities from a file into a lookup index."""
         with open(city_set_path, 'r') as file:
-            return file.read().strip().split('\n')
+            return CityIndex(file.read().strip().split('\n'))
 
 
 def validate_date_format(date_str: str) -> bool:
@@ -136,63 +299,304 @@ def validate_date_format(date_str: str) -> bool:
     return bool(re.match(r'^\d{4}-\d{2}-\d{2}$', date_str))
 
 
-def to_string(data) -> str:
-    """Convert data to a string format, handling different data types."""
-    if data is not None:
-        if isinstance(data, DataFrame):
-            return data.to_string(index=False)
-        return str(data)
-    return "None"
+def process_query(agent: ReActFramework, number: int, query: str, output_path: str, model_name: str,
+                  metrics: Optional[Metrics] = None, resume: bool = False) -> int:
+    """Run the agent on a single query and save the results to its own plan file."""
+    # Run the agent to get the results
+    planner_results, scratchpad, action_log = agent.run(query, query_id=number, resume=resume)
+    save_results(number, planner_results, scratchpad, action_log, output_path, model_name, metrics)
+    if agent.checkpoint is not None:
+        agent.checkpoint.remove(number)
+    return number
+
+
+def plan_query(planner, number: int, query: str, planner_input: Tuple[str, str], action_log: List[Dict[str, Any]],
+               metrics: Optional[Metrics] = None) -> str:
+    """Run a deferred Planner action on a planner worker and record the plan as its observation."""
+    text, planner_query = planner_input
+    started = time.perf_counter()
+    planner_results = planner.run(text, planner_query, query_id=number)
+    if metrics is not None:
+        metrics.record_span('plan', time.perf_counter() - started, number)
+    action_log[-1]['observation'] = planner_results
+    return planner_results
+
+
+def save_results(number: int, planner_results: str, scratchpad: str, action_log: List[Dict[str, Any]],
+                 output_path: str, model_name: str, metrics: Optional[Metrics] = None) -> int:
+    """Save the results of a query to its own plan file."""
+    output_file = os.path.join(output_path, f'generated_plan_{number}.json')
+
+    started = time.perf_counter()
+    if os.path.exists(output_file):
+        with open(output_file, 'r') as f:
+            result = json.load(f)
+    else:
+        result = [{}]
+
+    if planner_results == 'Max Token Length Exceeded.':
+        result[-1][f'{model_name}_two-stage_results_logs'] = scratchpad
+        result[-1][f'{model_name}_two-stage_results'] = 'Max Token Length Exceeded.'
+        action_log[-1]['state'] = 'Max Token Length of Planner Exceeded.'
+    else:
+        result[-1][f'{model_name}_two-stage_results_logs'] = scratchpad
+        result[-1][f'{model_name}_two-stage_results'] = planner_results
+        result[-1][f'{model_name}_two-stage_action_logs'] = action_log
+
+    # Save the results to a file
+    with open(output_file, 'w') as f:
+        json.dump(result, f, indent=4)
+
+    if metrics is not None:
+        metrics.record_span('io.write_plan', time.perf_counter() - started, number)
+        metrics.write_query_summary(os.path.join(output_path, 'metrics', f'query_{number}.json'), number)
+    return number
+
+
+def load_queries(set_type: str, dataset_path: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (number, query) pairs as they are read, so the first query can start before the split is loaded.
+
+    `dataset_path` is a local JSONL file with a "query" field per line; otherwise the split is streamed
+    from the Hugging Face hub.
+    """
+    if dataset_path is not None:
+        with open(dataset_path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate((line for line in f if line.strip()), start=1):
+                yield number, json.loads(line)['query']
+        return
+    from datasets import load_dataset
+    dataset = load_dataset('osunlp/TravelPlanner', set_type, split=set_type, streaming=True)
+    for number, data in enumerate(dataset, start=1):
+        yield number, data['query']
+
+
+def run_queries(agents: List[ReActFramework], jobs: Iterable[Tuple[int, str]], output_path: str, model_name: str,
+                metrics: Optional[Metrics] = None, metrics_file: Optional[str] = None,
+                total: Optional[int] = None, planners: Optional[List[Any]] = None, resume: bool = False,
+                completed: Optional[CompletedIndex] = None) -> List[int]:
+    """Run (number, query) jobs with one in-flight query per agent and return the numbers that failed.
+
+    Jobs are submitted while `jobs` is being consumed, so a lazily loaded dataset starts immediately.
+    With `planners` the run is pipelined: an agent is released as soon as it reaches the Planner action
+    and its notebook waits for the next idle planner, so gathering for one query overlaps planning for
+    the previous ones. The agents' handlers must then be built with `defer_planner=True`.
+    With `resume`, agents continue queries from their checkpoints. Finished queries are added to `completed`.
+    """
+    from tqdm import tqdm
+
+    if total is None and hasattr(jobs, '__len__'):
+        total = len(jobs)
+    idle_agents = queue.Queue()
+    for agent in agents:
+        idle_agents.put(agent)
+    idle_planners = queue.Queue()
+    for planner in planners or []:
+        idle_planners.put(planner)
+
+    def run_job(number: int, query: str) -> int:
+        agent = idle_agents.get()
+        try:
+            if not planners:
+                process_query(agent, number, query, output_path, model_name, metrics, resume)
+                if completed is not None:
+                    completed.add(number)
+                return number
+            planner_results, scratchpad, action_log = agent.run(query, query_id=number, resume=resume)
+            planner_input = agent.action_handler.planner_input
+            checkpoint = agent.checkpoint
+        finally:
+            idle_agents.put(agent)
+
+        if planner_input is not None:
+            planner = idle_planners.get()
+            try:
+                planner_results = plan_query(planner, number, query, planner_input, action_log, metrics)
+            finally:
+                idle_planners.put(planner)
+        save_results(number, planner_results, scratchpad, action_log, output_path, model_name, metrics)
+        if checkpoint is not None:
+            checkpoint.remove(number)
+        if completed is not None:
+            completed.add(number)
+        return number
+
+    failed = []
+    # Planner workers need threads of their own so that released agents can start the next query
+    workers = len(agents) + len(planners or [])
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=total) as progress:
+        futures = {executor.submit(run_job, number, query): number for number, query in jobs}
+        progress.total = len(futures)
+        progress.refresh()
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                print(f"Query {futures[future]} failed: {e}")
+            if metrics_file is not None:
+                metrics.write_prometheus(metrics_file)
+            progress.update(1)
+            progress.set_postfix(in_flight=min(workers, len(futures) - progress.n), failed=len(failed))
+    return sorted(failed)
 
 
 if __name__ == '__main__':
     # Command-line argument parsing
     parser = argparse.ArgumentParser()
-    parser.add_argument("--llama_url", default="http://localhost:11434/api/chat", type=str)
+    parser.add_argument("--llama_url", default=["http://localhost:11434/api/chat"], type=str, nargs='+',
+                        help="one or more Ollama chat endpoints to balance requests over")
     parser.add_argument("--model_name", default="llama3:8b-instruct-fp16", type=str)  # llama3:70b-instruct-q5_1
     parser.add_argument("--output_dir", default="./output/", type=str)
     parser.add_argument("--stream", default=False, action='store_true')
+    parser.add_argument("--pool_size", default=16, type=int)
+    parser.add_argument("--endpoint_concurrency", default=None, type=int, help="max in-flight requests per endpoint")
+    parser.add_argument("--max_retries", default=3, type=int, help="retries of a failed LLM request")
+    parser.add_argument("--health_interval", default=30.0, type=float, help="seconds between endpoint health probes")
+    parser.add_argument("--connect_timeout", default=5.0, type=float)
+    parser.add_argument("--read_timeout", default=600.0, type=float)
+    parser.add_argument("--concurrency", default=1, type=int, help="number of queries in flight at once")
+    parser.add_argument("--pipeline", default=False, action='store_true',
+                        help="hand finished notebooks to separate planner workers instead of planning inline")
+    parser.add_argument("--planner_model", default=None, type=str, help="model of the planner workers")
+    parser.add_argument("--planner_url", default=None, type=str, nargs='+',
+                        help="Ollama chat endpoints of the planner workers (default: --llama_url)")
+    parser.add_argument("--planner_concurrency", default=1, type=int, help="number of planner workers")
+    parser.add_argument("--cache_dir", default=None, type=str, help="directory of the LLM response cache")
+    parser.add_argument("--cache_size_mb", default=1024, type=int)
+    parser.add_argument("--replay", default=False, action='store_true', help="serve every LLM call from the cache")
+    parser.add_argument("--observation_format", default="table", choices=["table", "compact"])
+    parser.add_argument("--observation_tokens", default=1024, type=int, help="token budget of a compact observation")
+    parser.add_argument("--observation_top_k", default=None, type=int, help="rows kept in a compact observation")
+    parser.add_argument("--notebook_format", default="list", choices=["list", "compact"],
+                        help="planner input as the notebook's list repr or as deduplicated dense tables")
+    parser.add_argument("--notebook_tokens", default=4096, type=int, help="token budget of a compact notebook")
+    parser.add_argument("--thought_tokens", default=256, type=int, help="max tokens generated for a thought")
+    parser.add_argument("--action_tokens", default=256, type=int,
+                        help="max tokens generated for an action; Planner actions repeat the whole query")
+    parser.add_argument("--planner_tokens", default=1024, type=int, help="max tokens generated for a plan")
+    parser.add_argument("--num_ctx", default=None, type=int, help="context size of the agent model")
+    parser.add_argument("--planner_num_ctx", default=None, type=int, help="context size of the planner model")
+    parser.add_argument("--keep_alive", default="30m", type=str,
+                        help="how long the server keeps the models loaded between calls (-1 for always)")
+    parser.add_argument("--no_warm_up", default=False, action='store_true',
+                        help="do not load the models on every endpoint before the first query")
+    parser.add_argument("--constraint_filter", default=False, action='store_true',
+                        help="hide flights, hotels and restaurants that break the query's constraints")
+    parser.add_argument("--context_tokens", default=None, type=int, help="token budget of the conversation sent to the model")
+    parser.add_argument("--step_mode", default="two_call", choices=["two_call", "single"],
+                        help="ask for thought and action in two calls or in one")
+    parser.add_argument("--trace_compress", default=False, action='store_true', help="gzip the LLM trace file")
+    parser.add_argument("--fsync_interval", default=5.0, type=float, help="seconds between fsyncs of the trace file")
+    parser.add_argument("--metrics", default=False, action='store_true',
+                        help="write per-query timing summaries and a Prometheus text file")
+    parser.add_argument("--metrics_port", default=None, type=int, help="also serve the Prometheus text over HTTP")
+    parser.add_argument("--prefetch", default=False, action='store_true',
+                        help="start the tool lookups the query implies before the agent asks for them")
+    parser.add_argument("--prefetch_workers", default=8, type=int)
+    parser.add_argument("--store_dir", default=None, type=str, help="indexed database built by travel_db.py")
+    parser.add_argument("--resume", default=False, action='store_true',
+                        help="continue interrupted queries from their checkpoints")
+    parser.add_argument("--overwrite", default=False, action='store_true',
+                        help="run queries again even when the completed-query index lists them")
+    parser.add_argument("--num_shards", default=1, type=int, help="number of runs the split is divided between")
+    parser.add_argument("--shard_index", default=0, type=int, help="shard of the split run by this process")
+    parser.add_argument("--max_queries", default=None, type=int, help="stop after this many queries of the split")
+    parser.add_argument("--no_checkpoint", default=False, action='store_true',
+                        help="do not checkpoint the agent state after every step")
     parser.add_argument("--set_type", default="validation", type=str)
+    parser.add_argument("--dataset_path", default=None, type=str, help="local JSONL file of queries to run instead")
     args = parser.parse_args()
-
-    # Load the dataset based on the set type
-    dataset = load_dataset('osunlp/TravelPlanner', args.set_type)[args.set_type]
-
-    # Initialize the ReactAgent
-    agent = ReActFramework(args, mode='zero_shot', max_steps=20, max_retries=3,
-                       illegal_early_stop_patience=3,
-                       react_llm_name=args.model_name, planner_llm_name=args.model_name,
-                       agent_prompt=zeroshot_react_agent_prompt,
-                       action_mapping=action_mapping,
-                       action_handler=ActionHandler)
-
+    if args.replay and args.cache_dir is None:
+        parser.error("--replay requires --cache_dir")
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard_index must be in [0, --num_shards)")
+
+    # Tools and connections are shared; every agent gets its own messages, scratchpad, logs and notebook
+    transport = EndpointPool(args.llama_url, max_concurrency=args.endpoint_concurrency, max_retries=args.max_retries,
+                             health_interval=args.health_interval, pool_maxsize=max(args.pool_size, args.concurrency),
+                             connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+    cache = None
+    if args.cache_dir is not None:
+        cache = ResponseCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024, replay=args.replay)
+    if args.observation_format == 'compact':
+        encoder = get_encoder('compact', token_budget=args.observation_tokens, top_k=args.observation_top_k)
+    else:
+        encoder = get_encoder(args.observation_format)
+    # Every LLM request/response of the run is appended to one trace file
+    trace_file = f"trace_{time.strftime('%Y%m%d-%H%M%S')}.jsonl" + (".gz" if args.trace_compress else "")
+    trace = TraceWriter(os.path.join(args.output_dir, trace_file), fsync_interval=args.fsync_interval)
+    metrics = Metrics() if args.metrics or args.metrics_port else None
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    prefetcher = Prefetcher(args.prefetch_workers) if args.prefetch else None
     # Create output directory if it doesn't exist
     output_path = os.path.join(args.output_dir, args.set_type)
     os.makedirs(output_path, exist_ok=True)
-
-    # Process each query in the dataset
-    for number, data in enumerate(tqdm(dataset), start=1):
-        if number > 1: continue
-        query = data['query']
-        output_file = os.path.join(output_path, f'generated_plan_{number}.json')
-
-        if os.path.exists(output_file):
-            with open(output_file, 'r') as f:
-                result = json.load(f)
-        else:
-            result = [{}]
-
-        # Run the agent to get the results
-        planner_results, scratchpad, action_log = agent.run(query)
-        if planner_results == 'Max Token Length Exceeded.':
-            result[-1][f'{args.model_name}_two-stage_results_logs'] = scratchpad
-            result[-1][f'{args.model_name}_two-stage_results'] = 'Max Token Length Exceeded.'
-            action_log[-1]['state'] = 'Max Token Length of Planner Exceeded.'
-        else:
-            result[-1][f'{args.model_name}_two-stage_results_logs'] = scratchpad
-            result[-1][f'{args.model_name}_two-stage_results'] = planner_results
-            result[-1][f'{args.model_name}_two-stage_action_logs'] = action_log
-
-        # Save the results to a file
-        with open(output_file, 'w') as f:
-            json.dump(result, f, indent=4)
+    checkpoint = None if args.no_checkpoint else CheckpointStore(os.path.join(output_path, 'checkpoints'))
+    # Tools are only constructed when an agent first uses them
+    handler = ActionHandler(store_dir=args.store_dir)
+    planner_model = args.planner_model or args.model_name
+    generation = GenerationProfiles.from_args(args)
+    keep_alive = int(args.keep_alive) if args.keep_alive.lstrip('-').isdigit() else args.keep_alive
+    planner_transport, planners = None, None
+    if args.pipeline:
+        planner_transport = EndpointPool(args.planner_url or args.llama_url, max_concurrency=args.endpoint_concurrency,
+                                         max_retries=args.max_retries, health_interval=args.health_interval,
+                                         pool_maxsize=max(args.pool_size, args.planner_concurrency),
+                                         connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+        planners = [OllamaPlanner(planner_model, planner_transport, stream=args.stream, cache=cache, trace=trace,
+                                  metrics=metrics, generation=generation, keep_alive=keep_alive)
+                    for _ in range(max(1, args.planner_concurrency))]
+    agents = []
+    for worker in range(max(1, args.concurrency)):
+        # Initialize the ReactAgent
+        agents.append(ReActFramework(args, mode='zero_shot', max_steps=20, max_retries=args.max_retries,
+                                     illegal_early_stop_patience=3,
+                                     react_llm_name=args.model_name, planner_llm_name=planner_model,
+                                     agent_prompt=zeroshot_react_agent_prompt,
+                                     action_mapping=action_mapping,
+                                     action_handler=ActionHandler(shared_tools=handler.shared_tools, city_set=handler.city_set,
+                                                                  store_dir=args.store_dir, encoder=encoder,
+                                                                  defer_planner=args.pipeline,
+                                                                  notebook_format=args.notebook_format,
+                                                                  notebook_tokens=args.notebook_tokens,
+                                                                  constraint_filter=args.constraint_filter),
+                                     transport=transport,
+                                     trace=trace, metrics=metrics, prefetcher=prefetcher,
+                                     cache=cache, context_tokens=args.context_tokens,
+                                     step_mode=args.step_mode, checkpoint=checkpoint,
+                                     generation=generation, keep_alive=keep_alive))
+
+    if not args.no_warm_up and not args.replay:
+        # Load the models while the dataset and tools are being loaded, instead of on the first query
+        warm_ups = [(transport, args.model_name)] + ([(planner_transport, planner_model)] if planners else [])
+        for pool, model in warm_ups:
+            threading.Thread(target=pool.warm_up, args=(model, keep_alive), name='warm-up', daemon=True).start()
+
+    # Process this shard's queries of the dataset, streaming them from the source
+    jobs = load_queries(args.set_type, args.dataset_path)
+    if args.max_queries is not None:
+        jobs = itertools.islice(jobs, args.max_queries)
+    jobs = shard_jobs(jobs, args.num_shards, args.shard_index)
+    completed = CompletedIndex(output_path, args.model_name, f'{args.shard_index}-of-{args.num_shards}')
+    if not args.overwrite:
+        if len(completed):
+            print(f"Skipping the {len(completed)} queries already completed in {output_path}")
+        jobs = ((number, query) for number, query in jobs if number not in completed)
+
+    try:
+        failed = run_queries(agents, jobs, output_path, args.model_name, metrics,
+                             os.path.join(args.output_dir, 'metrics.prom') if metrics is not None else None,
+                             planners=planners, resume=args.resume, completed=completed)
+    finally:
+        trace.close()
+        transport.close()
+        if planner_transport is not None:
+            planner_transport.close()
+        if prefetcher is not None:
+            prefetcher.shutdown()
+    if failed:
+        print(f"{len(failed)} queries failed: {failed}")
+    if cache is not None:
+        print(f"LLM cache: {cache.hits} hits, {cache.misses} misses")
+    print(f"Tool cache: {shared_tool_cache.stats()}")